@@ -1,15 +1,17 @@
 import os
 import json
-import base64
 import time
 import logging
 import threading
 import sys
 from threading import Timer
+from scoring_scheduler import ScoringScheduler
 from dotenv import load_dotenv
 import websocket
-import sounddevice as sd
-from isitllm import llm_or_human  # This now returns (score_percentage, api_tokens)
+from audio_capture import AudioCapture, MicSource, SyntheticSource, WavFileSource
+from isitllm import StreamingScorer
+from metrics import METRICS, JsonLinesSink, PrometheusExporter
+from transcript_log import TranscriptLog
 
 load_dotenv()
 API_KEY = os.getenv("OPENAI_API_KEY") or sys.exit("ERROR: set OPENAI_API_KEY in .env")
@@ -19,16 +21,35 @@ HEADERS = [
     "OpenAI-Beta: realtime=v1"
 ]
 MIN_RUN_SECONDS = 60.0  # total run before auto-shutdown
-SEGMENT_SECONDS = 3.0  # record length per chunk
-FLUSH_INTERVAL = 5.0  # flush buffer for scoring
-TRANSCRIPT_FILE = "transcript.txt"
-
-_buffer, total_score, n_scores = [], 0.0, 0
+SAMPLE_RATE = 16000  # pcm16 mono, as configured in transcription_session.update
+CHUNK_SECONDS = 0.25  # audio per input_audio_buffer.append
+COMMIT_SECONDS = 3.0  # audio between input_audio_buffer.commit messages
+AUDIO_QUEUE_SIZE = 32  # encoded chunks waiting to be sent before backpressure applies
+AUDIO_BACKPRESSURE = "drop_oldest"  # or "drop_newest" / "block"; see audio_capture.AudioCapture
+AUDIO_SOURCE = os.getenv("AUDIO_SOURCE", "mic")  # "mic", "synthetic" or a path to a 16 kHz PCM16 WAV file
+FLUSH_INTERVAL = 5.0  # fixed scoring cadence
+MAX_PENDING_WORDS = 150  # backlog predicted per flush; older words only extend the context
+TRANSCRIPT_FILE = "transcript.jsonl"  # base path; segments are transcript.NNNNNN.jsonl (see transcript_log)
+# Transcript retention; 0 keeps every recorded session.
+TRANSCRIPT_MAX_BYTES = int(os.getenv("TRANSCRIPT_MAX_BYTES", "0"))
+TRANSCRIPT_MAX_AGE_DAYS = float(os.getenv("TRANSCRIPT_MAX_AGE_DAYS", "0"))
+VERBOSE_SCORING = os.getenv("VERBOSE_SCORING", "0") == "1"  # per-word match log from the scorer
+STREAM_CONTEXT_POLICY = "words:200"  # rolling context kept in front of each prediction
+METRICS_PORT = os.getenv("METRICS_PORT")  # serve Prometheus text at http://127.0.0.1:<port>/metrics
+METRICS_FILE = os.getenv("METRICS_FILE")  # append metric events as JSON lines
+
+# Words are fed in as transcription events arrive; each flush scores only the new ones.
+_scorer = StreamingScorer(context_policy=STREAM_CONTEXT_POLICY, verbose=VERBOSE_SCORING,
+                          max_pending_words=MAX_PENDING_WORDS)
+n_scores = 0
+_state_lock = threading.Lock()  # guards n_scores / _api_tokens_total, written by the scoring worker
+_scheduler = None
 _api_tokens_total = 0  # Optional: to accumulate total API tokens from isitllm
 _is_running = False
 _shutdown_timer = None
 _ws = None
-transcript_fh = open(TRANSCRIPT_FILE, "a", buffering=1)
+_capture = None
+_transcript = None  # TranscriptLog, opened when the socket connects
 
 logging.basicConfig(
     level=logging.INFO,
@@ -38,60 +59,66 @@ logging.basicConfig(
 
 
 def flush_and_score():
-    global _buffer, total_score, n_scores, _api_tokens_total, _shutdown_timer
+    """Score the words transcribed since the last run; called on the scoring worker thread."""
+    global n_scores, _api_tokens_total
     if not _is_running: return
-    text = " ".join(_buffer).strip()
-    _buffer.clear()
-    if text:
+    if _scorer.pending_words:
         try:
-            # llm_or_human now returns (score_percentage, api_tokens)
-            score_percentage, api_tokens_segment = llm_or_human(text)
-
-            total_score += score_percentage
-            n_scores += 1
-            _api_tokens_total += api_tokens_segment  # Accumulate API tokens
-
-            # avg_percentage is now an average of scores that are already 0-100
-            avg_percentage = total_score / n_scores if n_scores > 0 else 0.0
-
-            logging.info(
-                f"🔍 [SEGMENT SCORE] {score_percentage:.1f}% | Running Avg {avg_percentage:.1f}% (API Tokens: {api_tokens_segment})")
+            with METRICS.timer("flush_seconds"):
+                score_percentage, n_words, api_tokens_segment = _scorer.score_pending()
+
+            if n_words:
+                with _state_lock:
+                    n_scores += 1
+                    _api_tokens_total += api_tokens_segment  # Accumulate API tokens
+
+                # Running match rate over every word scored so far in the session
+                avg_percentage = _scorer.score
+                METRICS.inc("segments_scored_total")
+                METRICS.set_gauge("segment_score", score_percentage)
+                METRICS.set_gauge("running_avg_score", avg_percentage)
+
+                sched = _scheduler.stats() if _scheduler else {}
+                logging.info(
+                    f"🔍 [SEGMENT SCORE] {score_percentage:.1f}% over {n_words} words | Running {avg_percentage:.1f}% "
+                    f"(API Tokens: {api_tokens_segment}, lag {sched.get('last_lag', 0.0):.1f}s, "
+                    f"queue {sched.get('queue_depth', 0)}, coalesced {sched.get('coalesced', 0)})")
         except Exception as e:
+            METRICS.inc("scoring_errors_total")
             logging.error(f"Scoring error: {e}")
-    # schedule next flush
-    if _is_running:  # Only schedule next if still running
-        Timer(FLUSH_INTERVAL, flush_and_score).start()
-
-
-def record_loop():
-    """Continuously record fixed-length chunks, send append+commit."""
-    global _is_running
-    samplerate = 16000
-    channels = 1
-    while _is_running and _ws and _ws.sock and _ws.sock.connected:  # Added _ws check
-        logging.info(f"🎙 Recording {SEGMENT_SECONDS}s of audio…")
-        recording = sd.rec(int(SEGMENT_SECONDS * samplerate), samplerate=samplerate, channels=channels, dtype="int16")
-        sd.wait()
-        pcm = recording.tobytes()
-        b64 = base64.b64encode(pcm).decode("ascii")
-
-        # append
-        append_msg = {"type": "input_audio_buffer.append", "audio": b64}
-        if _is_running and _ws and _ws.sock and _ws.sock.connected:  # Check before send
-            _ws.send(json.dumps(append_msg))
-            logging.info("→ SENT append chunk")
-        else:
-            break  # Exit loop if not running or ws disconnected
-
-        # commit
-        commit_msg = {"type": "input_audio_buffer.commit"}
-        if _is_running and _ws and _ws.sock and _ws.sock.connected:  # Check before send
-            _ws.send(json.dumps(commit_msg))
-            logging.info("→ SENT commit")
-        else:
-            break  # Exit loop if not running or ws disconnected
 
-    logging.info("🎙 Record loop exiting")
+
+def send_audio_message(msg):
+    """Send an append/commit message from the audio sender thread."""
+    if _is_running and _ws and _ws.sock and _ws.sock.connected:
+        _ws.send(json.dumps(msg))
+        if msg["type"] == "input_audio_buffer.commit":
+            logging.info("→ SENT commit")
+    else:
+        raise ConnectionError("WebSocket is not connected")
+
+
+def make_audio_source():
+    if AUDIO_SOURCE == "mic":
+        return MicSource(samplerate=SAMPLE_RATE)
+    if AUDIO_SOURCE == "synthetic":
+        return SyntheticSource(seconds=MIN_RUN_SECONDS, samplerate=SAMPLE_RATE)
+    return WavFileSource(AUDIO_SOURCE, samplerate=SAMPLE_RATE, channels=1)
+
+
+def start_capture():
+    """Start continuous capture; audio is chunked, encoded and sent off the capture thread."""
+    global _capture
+    _capture = AudioCapture(
+        make_audio_source(),
+        send_audio_message,
+        chunk_seconds=CHUNK_SECONDS,
+        commit_seconds=COMMIT_SECONDS,
+        queue_size=AUDIO_QUEUE_SIZE,
+        backpressure=AUDIO_BACKPRESSURE,
+    )
+    _capture.start()
+    logging.info(f"🎙 Capturing from {AUDIO_SOURCE} ({CHUNK_SECONDS}s chunks, commit every {COMMIT_SECONDS}s)…")
 
 
 def initiate_shutdown():
@@ -101,7 +128,7 @@ def initiate_shutdown():
 
 def stop_all():
     """Clean up everything."""
-    global _is_running, _shutdown_timer, total_score, n_scores, _api_tokens_total, _ws
+    global _is_running, _shutdown_timer, n_scores, _api_tokens_total, _ws, _capture, _scheduler
     if not _is_running: return  # Already stopping or stopped
 
     logging.info("Initiating shutdown sequence...")
@@ -111,6 +138,16 @@ def stop_all():
         _shutdown_timer.cancel()
         _shutdown_timer = None
 
+    if _scheduler:
+        _scheduler.stop(timeout=5.0)  # let an in-flight scoring pass finish briefly, but don't hang shutdown
+        logging.info(f"⏱ Scoring scheduler stopped: {_scheduler.stats()}")
+        _scheduler = None
+
+    if _capture:
+        _capture.stop(flush=False)  # the socket is closing, so whatever is still queued can't be transcribed
+        logging.info(f"🎙 Capture stopped: {_capture.stats()}")
+        _capture = None
+
     # Close WebSocket connection if it exists and is open
     if _ws and _ws.sock and _ws.sock.connected:
         logging.info("Closing WebSocket connection...")
@@ -121,39 +158,39 @@ def stop_all():
     _ws = None  # Clear WebSocket reference
 
     # Log final score summary
-    if n_scores > 0:
-        final_avg_score = total_score / n_scores
+    with _state_lock:
+        n_scores_final, api_tokens_final = n_scores, _api_tokens_total
+    if n_scores_final > 0:
         logging.info(
-            f"🏁 [FINAL SUMMARY] Average LLM-likeness: {final_avg_score:.1f}% across {n_scores} scored segments.")
-        logging.info(f"🏁 [FINAL SUMMARY] Total API tokens used for scoring (non-cached): {_api_tokens_total}")
+            f"🏁 [FINAL SUMMARY] Average LLM-likeness: {_scorer.score:.1f}% over {_scorer.predictions} words "
+            f"across {n_scores_final} scored segments.")
+        logging.info(f"🏁 [FINAL SUMMARY] Total API tokens used for scoring (non-cached): {api_tokens_final}")
     else:
         logging.info("🏁 [FINAL SUMMARY] No segments were scored.")
 
-    if transcript_fh and not transcript_fh.closed:
+    if _transcript:
         try:
-            logging.info(f"Flushing transcript data to '{TRANSCRIPT_FILE}'...")
-            transcript_fh.flush()  # Explicitly flush Python's internal buffer
-            # Ensure data is written to disk by the OS
-            # This is a more forceful flush to the physical storage
-            if hasattr(transcript_fh, 'fileno'): # Check if it's a real file descriptor
-                os.fsync(transcript_fh.fileno())
-            transcript_fh.close()
-            logging.info(f"Transcript file '{TRANSCRIPT_FILE}' flushed and closed.")
+            _transcript.close()  # flushes, fsyncs and indexes the segment
+            logging.info(f"Transcript session {_transcript.session_id} saved: {_transcript.stats()}")
         except Exception as e:
-            logging.error(f"Error flushing/closing transcript file: {e}")
+            logging.error(f"Error flushing/closing transcript log: {e}")
 
     logging.info("Clean shutdown complete.")
 
 
 def on_open(ws_app):
-    global _ws, _is_running
+    global _ws, _is_running, _transcript
     _ws = ws_app
+    if _transcript is None:
+        _transcript = TranscriptLog(TRANSCRIPT_FILE, max_total_bytes=TRANSCRIPT_MAX_BYTES,
+                                    max_age_days=TRANSCRIPT_MAX_AGE_DAYS)
+        logging.info(f"📝 Logging transcript session {_transcript.session_id} to {TRANSCRIPT_FILE}")
     _is_running = True
     logging.info("WS open; awaiting transcription_session.created…")
 
 
 def on_message(ws_app, raw):
-    global _shutdown_timer, _is_running  # Added _is_running
+    global _shutdown_timer, _is_running, _scheduler
     if not _is_running: return  # Don't process messages if shutting down
 
     data = json.loads(raw)
@@ -175,12 +212,13 @@ def on_message(ws_app, raw):
         return
 
     if t == "transcription_session.updated":
-        logging.info("✅ session.updated → starting record loop & flush")
-        # start periodic flush
+        logging.info("✅ session.updated → starting audio capture & flush")
+        # start fixed-rate scoring on its own worker thread
         if _is_running:  # Check before starting new timers/threads
-            flush_and_score()
-            # start recording loop
-            threading.Thread(target=record_loop, daemon=True).start()
+            _scheduler = ScoringScheduler(FLUSH_INTERVAL, flush_and_score)
+            _scheduler.start()
+            # start continuous capture
+            start_capture()
             # schedule auto shutdown
             if _shutdown_timer: _shutdown_timer.cancel()
             _shutdown_timer = Timer(MIN_RUN_SECONDS, initiate_shutdown)
@@ -195,18 +233,18 @@ def on_message(ws_app, raw):
         delta = data.get("delta", "").strip()
         if delta:
             logging.info(f"[{ts}] Δ {delta}")
-            if transcript_fh and not transcript_fh.closed:
-                transcript_fh.write(f"[{ts}] Δ {delta}\n")
-            _buffer.append(delta)
+            if _transcript:
+                _transcript.write("delta", data.get("item_id"), data["delta"])
+            _scorer.feed_delta(data.get("item_id"), data["delta"])  # unstripped, so word breaks survive
         return
 
     if t == "conversation.item.input_audio_transcription.completed":
         full = data.get("transcript", "").strip()
         if full:
             logging.info(f"[{ts}] ✔ {full}")
-            if transcript_fh and not transcript_fh.closed:
-                transcript_fh.write(f"[{ts}] ✔ {full}\n")
-            _buffer.append(full)  # Append full transcript as well for scoring context
+            if _transcript:
+                _transcript.write("completed", data.get("item_id"), full)
+            _scorer.feed_completed(data.get("item_id"), full)  # Replaces this item's deltas
         return
 
 
@@ -228,6 +266,16 @@ def wait_for_enter():
 
 
 if __name__ == "__main__":
+    if AUDIO_SOURCE not in ("mic", "synthetic"):
+        try:
+            make_audio_source()  # a WAV file in the wrong format fails here, not after connecting
+        except Exception as e:
+            sys.exit(f"ERROR: {e}")
+    if METRICS_PORT:
+        PrometheusExporter(METRICS, port=int(METRICS_PORT))
+        logging.info(f"📈 Metrics at http://127.0.0.1:{METRICS_PORT}/metrics")
+    if METRICS_FILE:
+        METRICS.add_sink(JsonLinesSink(METRICS_FILE))
     threading.Thread(target=wait_for_enter, daemon=True).start()
     ws_app_instance = websocket.WebSocketApp(  # Renamed for clarity
         WS_URL,
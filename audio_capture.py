@@ -0,0 +1,358 @@
+import argparse
+import base64
+import logging
+import queue
+import threading
+import time
+import wave
+
+import numpy as np
+
+# Gap-free audio capture for the realtime client. A source (microphone, WAV
+# file or synthetic tone) pushes blocks from its callback into a preallocated
+# RingBuffer. A chunker thread cuts fixed-size chunks out of the ring and
+# base64-encodes them into a bounded queue, and a sender thread turns them
+# into input_audio_buffer.append / commit messages. Capture never waits on
+# encoding or the network, so no audio is lost between segments.
+
+BACKPRESSURE_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class RingBuffer:
+    """Fixed-size int16 frame buffer; writes never allocate and overwrite the oldest audio when full."""
+
+    def __init__(self, capacity_frames, channels=1, dtype=np.int16):
+        self._data = np.zeros((capacity_frames, channels), dtype=dtype)
+        self.capacity = capacity_frames
+        self.channels = channels
+        self._write_pos = 0
+        self._available = 0
+        self._cond = threading.Condition()
+        self.overrun_frames = 0
+        self.closed = False
+
+    def write(self, frames):
+        n = len(frames)
+        if n > self.capacity:
+            frames = frames[-self.capacity:]
+            self.overrun_frames += n - self.capacity
+            n = self.capacity
+        with self._cond:
+            end = self._write_pos + n
+            if end <= self.capacity:
+                self._data[self._write_pos:end] = frames
+            else:
+                split = self.capacity - self._write_pos
+                self._data[self._write_pos:] = frames[:split]
+                self._data[:n - split] = frames[split:]
+            self._write_pos = end % self.capacity
+            overflow = self._available + n - self.capacity
+            if overflow > 0:
+                self.overrun_frames += overflow
+            self._available = min(self.capacity, self._available + n)
+            self._cond.notify_all()
+
+    def read_into(self, out, timeout=None):
+        """Fill out (a preallocated (n, channels) array) with the oldest n frames.
+
+        Blocks until n frames are available; returns False on timeout or once
+        the buffer is closed and drained below n frames.
+        """
+        n = len(out)
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._available >= n or self.closed, timeout):
+                return False
+            if self._available < n:
+                return False
+            start = (self._write_pos - self._available) % self.capacity
+            end = start + n
+            if end <= self.capacity:
+                out[:] = self._data[start:end]
+            else:
+                split = self.capacity - start
+                out[:split] = self._data[start:]
+                out[split:] = self._data[:n - split]
+            self._available -= n
+            return True
+
+    def drain(self):
+        """Return whatever is left (a copy), used to flush a final partial chunk."""
+        with self._cond:
+            n = self._available
+            start = (self._write_pos - n) % self.capacity
+            idx = (np.arange(n) + start) % self.capacity
+            self._available = 0
+            return self._data[idx].copy()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return self._available
+
+
+class MicSource:
+    """Microphone capture through a callback-driven sounddevice.InputStream."""
+
+    def __init__(self, samplerate=16000, channels=1, blocksize=1024):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize
+        self._stream = None
+        self.status_errors = 0
+
+    def start(self, on_frames):
+        # Imported here so the rest of the module (file/synthetic sources) works without PortAudio.
+        import sounddevice as sd
+
+        def callback(indata, frames, time_info, status):
+            if status:
+                self.status_errors += 1
+            on_frames(indata)
+
+        self._stream = sd.InputStream(samplerate=self.samplerate, channels=self.channels, dtype="int16",
+                                      blocksize=self.blocksize, callback=callback)
+        self._stream.start()
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+
+class _ThreadedSource:
+    """Base for sources that produce blocks on their own thread, paced like a real device."""
+
+    def __init__(self, samplerate=16000, channels=1, blocksize=1024, realtime=True):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize
+        self.realtime = realtime
+        self._stop = threading.Event()
+        self._thread = None
+        self.finished = threading.Event()
+
+    def blocks(self):
+        raise NotImplementedError
+
+    def _run(self, on_frames):
+        next_time = time.monotonic()
+        for block in self.blocks():
+            if self._stop.is_set():
+                break
+            on_frames(block)
+            if self.realtime:
+                next_time += len(block) / self.samplerate
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        self.finished.set()
+
+    def start(self, on_frames):
+        self._thread = threading.Thread(target=self._run, args=(on_frames,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class WavFileSource(_ThreadedSource):
+    """Replay a 16-bit PCM WAV file as if it were a microphone.
+
+    samplerate and channels, if given, are what the consumer expects; a file
+    in any other format is rejected rather than streamed as garbled audio.
+    """
+
+    def __init__(self, path, blocksize=1024, realtime=True, samplerate=None, channels=None):
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError(f"{path}: only 16-bit PCM WAV files are supported")
+            if samplerate is not None and wav.getframerate() != samplerate:
+                raise ValueError(f"{path}: sample rate is {wav.getframerate()} Hz, expected {samplerate} Hz "
+                                 f"(e.g. ffmpeg -i in.wav -ar {samplerate} -ac 1 out.wav)")
+            if channels is not None and wav.getnchannels() != channels:
+                raise ValueError(f"{path}: has {wav.getnchannels()} channels, expected {channels}")
+            super().__init__(wav.getframerate(), wav.getnchannels(), blocksize, realtime)
+        self.path = path
+
+    def blocks(self):
+        with wave.open(self.path, "rb") as wav:
+            while True:
+                raw = wav.readframes(self.blocksize)
+                if not raw:
+                    return
+                yield np.frombuffer(raw, dtype=np.int16).reshape(-1, self.channels)
+
+
+class SyntheticSource(_ThreadedSource):
+    """A sine tone of the given length, for tests and benchmarks without audio hardware."""
+
+    def __init__(self, seconds=5.0, frequency=440.0, samplerate=16000, blocksize=1024, realtime=True):
+        super().__init__(samplerate, 1, blocksize, realtime)
+        self.seconds = seconds
+        self.frequency = frequency
+
+    def blocks(self):
+        total = int(self.seconds * self.samplerate)
+        block = np.empty((self.blocksize, 1), dtype=np.int16)
+        t = np.arange(self.blocksize)
+        for start in range(0, total, self.blocksize):
+            n = min(self.blocksize, total - start)
+            phase = 2 * np.pi * self.frequency * (start + t[:n]) / self.samplerate
+            block[:n, 0] = (np.sin(phase) * 8000).astype(np.int16)
+            yield block[:n]
+
+
+class AudioCapture:
+    """Stream a source into input_audio_buffer.append / commit messages without gaps.
+
+    chunk_seconds sets how much audio goes into each append message and
+    commit_seconds how often a commit follows; the two are independent. When
+    the sender falls behind and the queue of encoded chunks is full,
+    backpressure decides what happens: "drop_oldest" discards the oldest
+    queued chunk, "drop_newest" discards the new one, and "block" stalls the
+    chunker so audio waits in the ring buffer (which overwrites its oldest
+    frames once full). send is called with each message dict.
+    """
+
+    def __init__(self, source, send, chunk_seconds=0.25, commit_seconds=3.0, buffer_seconds=30.0,
+                 queue_size=32, backpressure="drop_oldest"):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"backpressure must be one of {BACKPRESSURE_POLICIES}, not {backpressure!r}")
+        self.source = source
+        self.send = send
+        self.samplerate = source.samplerate
+        self.chunk_frames = max(1, int(chunk_seconds * self.samplerate))
+        self.commit_frames = max(1, int(commit_seconds * self.samplerate))
+        self.backpressure = backpressure
+        self.ring = RingBuffer(int(buffer_seconds * self.samplerate), source.channels)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._running = False
+        self._flush = True
+        self._threads = []
+        self.chunks_sent = 0
+        self.commits_sent = 0
+        self.chunks_dropped = 0
+        self.send_errors = 0
+
+    def start(self):
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._chunk_loop, name="audio-chunker", daemon=True),
+            threading.Thread(target=self._send_loop, name="audio-sender", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        self.source.start(self.ring.write)
+
+    def stop(self, flush=True):
+        """Stop capture; with flush, the audio already captured is still sent and committed."""
+        self.source.stop()
+        self._running = False
+        self.ring.close()
+        self._threads[0].join()
+        self._flush = flush
+        if flush:
+            tail = self.ring.drain()
+            if len(tail):
+                self._enqueue(tail)
+        else:
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+        self._queue.put(None)
+        self._threads[1].join()
+
+    def _enqueue(self, frames):
+        message = {"type": "input_audio_buffer.append",
+                   "audio": base64.b64encode(memoryview(frames)).decode("ascii")}
+        item = (message, len(frames))
+        if self.backpressure == "block":
+            self._queue.put(item)
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.chunks_dropped += 1
+            if self.backpressure == "drop_newest":
+                return
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(item)
+
+    def _chunk_loop(self):
+        chunk = np.empty((self.chunk_frames, self.ring.channels), dtype=np.int16)  # reused for every chunk
+        while self._running or len(self.ring) >= self.chunk_frames:
+            if self.ring.read_into(chunk, timeout=0.5):
+                self._enqueue(chunk)
+
+    def _send_loop(self):
+        uncommitted = 0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            message, frames = item
+            try:
+                self.send(message)
+                self.chunks_sent += 1
+                uncommitted += frames
+                if uncommitted >= self.commit_frames:
+                    self.send({"type": "input_audio_buffer.commit"})
+                    self.commits_sent += 1
+                    uncommitted = 0
+            except Exception as e:
+                self.send_errors += 1
+                logging.error(f"Audio send failed: {e}")
+        if uncommitted and self._flush:
+            try:
+                self.send({"type": "input_audio_buffer.commit"})
+                self.commits_sent += 1
+            except Exception as e:
+                self.send_errors += 1
+                logging.error(f"Final audio commit failed: {e}")
+
+    def stats(self):
+        return {
+            "chunks_sent": self.chunks_sent,
+            "commits_sent": self.commits_sent,
+            "chunks_dropped": self.chunks_dropped,
+            "overrun_frames": self.ring.overrun_frames,
+            "queue_depth": self._queue.qsize(),
+            "send_errors": self.send_errors,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dry-run audio capture and print what would be sent.")
+    parser.add_argument("--wav", help="replay this 16-bit PCM WAV file instead of a synthetic tone")
+    parser.add_argument("--seconds", type=float, default=5.0, help="length of the synthetic tone")
+    parser.add_argument("--chunk-seconds", type=float, default=0.25)
+    parser.add_argument("--commit-seconds", type=float, default=3.0)
+    parser.add_argument("--fast", action="store_true", help="feed the source as fast as possible")
+    args = parser.parse_args(argv)
+
+    if args.wav:
+        source = WavFileSource(args.wav, realtime=not args.fast)
+    else:
+        source = SyntheticSource(seconds=args.seconds, realtime=not args.fast)
+    sent_bytes = []
+    capture = AudioCapture(source, lambda msg: sent_bytes.append(len(msg.get("audio", ""))),
+                           chunk_seconds=args.chunk_seconds, commit_seconds=args.commit_seconds)
+    capture.start()
+    source.finished.wait()
+    capture.stop()
+    print(capture.stats(), f"{sum(sent_bytes)} base64 bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+DOCUMENT_EXTENSIONS = (".txt", ".md")
+
+
+def iter_documents(source):
+    """Yield (doc_id, text) from a JSONL file, a directory of text files or a single text file.
+
+    JSONL lines need a "text" field and may carry an "id"; lines without one
+    are identified by their line number. A single file not ending in .jsonl
+    is one document, identified by its path.
+    """
+    if os.path.isfile(source) and not source.endswith(".jsonl"):
+        with open(source, encoding="utf-8") as f:
+            yield source, f.read()
+        return
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(DOCUMENT_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    with open(path, encoding="utf-8") as f:
+                        yield os.path.relpath(path, source), f.read()
+        return
+
+    with open(source, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping malformed line {line_no} in {source}: {e}")
+                continue
+            yield str(record.get("id", line_no)), record.get("text", "")
+
+
+def load_checkpoint(output_path):
+    """Return the ids already scored in output_path, repairing a torn last line from a crash."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            # The last write was cut off; drop it so the document is scored again.
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    for line in data.decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if "error" not in record:
+            done.add(record["id"])
+    return done
+
+
+def score_document(doc_id, text, options):
+    """Worker entry point: score one document and return its result record."""
+    from isitllm import llm_or_human
+
+    stats = {}
+    start = time.time()
+    try:
+        score, api_tokens = llm_or_human(
+            text,
+            max_sentences=options.get("max_sentences"),
+            concurrency=options.get("concurrency", 1),
+            speculative_words=options.get("speculative_words", 0),
+            context_policy=options.get("context_policy"),
+            time_limit=options.get("time_limit"),
+            stats=stats,
+            verbose=options.get("verbose", False),
+            sampling=options.get("sampling", "head"),
+            early_stop=options.get("early_stop"),
+            confidence=options.get("confidence", 0.95),
+            token_budget=options.get("token_budget"),
+        )
+    except Exception as e:
+        return {"id": doc_id, "error": str(e), "elapsed_seconds": round(time.time() - start, 3)}
+    return {
+        "id": doc_id,
+        "score": round(score, 4),
+        "api_tokens": api_tokens,
+        "predictions": stats.get("predictions", 0),
+        "correct": stats.get("correct", 0),
+        "failed": stats.get("failed", 0),
+        "budget_exhausted": stats.get("budget_exhausted", False),
+        "time_limit_reached": stats.get("time_limit_reached", False),
+        "stopped_early": stats.get("stopped_early", False),
+        "score_interval": [round(x, 4) for x in stats.get("score_interval", (0.0, 100.0))],
+        "elapsed_seconds": round(time.time() - start, 3),
+    }
+
+
+def _load_predictor(path):
+    import isitllm
+    isitllm.set_predictor(path)
+
+
+def run_batch(source, output_path, workers, options, predictor_path=None):
+    done = load_checkpoint(output_path)
+    if done:
+        print(f"Resuming: {len(done)} documents already scored in {output_path}.")
+
+    scored = failed = 0
+    start = time.time()
+    documents = ((doc_id, text) for doc_id, text in iter_documents(source) if doc_id not in done)
+    # Results are appended as they finish; one line per document, flushed
+    # immediately so a crash loses at most the documents still in flight.
+    with open(output_path, "a", encoding="utf-8") as out, ProcessPoolExecutor(
+            max_workers=workers,
+            # A local predictor is loaded once per worker process, not once per document.
+            initializer=_load_predictor if predictor_path else None,
+            initargs=(predictor_path,) if predictor_path else ()) as pool:
+        in_flight = set()
+        exhausted = False
+        while in_flight or not exhausted:
+            # Keep a small window of submissions so huge inputs are streamed, not queued up front.
+            while not exhausted and len(in_flight) < workers * 2:
+                try:
+                    doc_id, text = next(documents)
+                except StopIteration:
+                    exhausted = True
+                    break
+                in_flight.add(pool.submit(score_document, doc_id, text, options))
+            if not in_flight:
+                break
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                if "error" in record:
+                    failed += 1
+                    print(f"✗ {record['id']}: {record['error']}")
+                else:
+                    scored += 1
+                    print(f"✓ {record['id']}: {record['score']:.2f}% ({record['predictions']} predictions)")
+        os.fsync(out.fileno())
+
+    elapsed = time.time() - start
+    print(f"Scored {scored} documents ({failed} failed) in {elapsed:.1f}s; results in {output_path}.")
+    return scored, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a corpus of documents with llm_or_human.")
+    parser.add_argument("source", help="JSONL file with {'id', 'text'} records, or a directory of .txt/.md files")
+    parser.add_argument("-o", "--output", default="scores.jsonl", help="results JSONL; also the resume checkpoint")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 4, help="worker processes")
+    parser.add_argument("--concurrency", type=int, default=1, help="prediction threads per document")
+    parser.add_argument("--max-sentences", type=int, default=4, help="sentences to score per document; 0 for all")
+    parser.add_argument("--context-policy", default=None, help="full, sentences:N, words:N or tokens:N")
+    parser.add_argument("--speculative-words", type=int, default=0, help="words drafted per request (0 = off)")
+    parser.add_argument("--time-limit", type=float, default=None, help="per-document time limit in seconds")
+    parser.add_argument("--sampling", choices=("head", "spread"), default="head",
+                        help="score the first sentences, or positions spread over the whole document")
+    parser.add_argument("--early-stop", default=None, help="precision:P or threshold:T (percent); see llm_or_human")
+    parser.add_argument("--confidence", type=float, default=0.95, help="confidence level for --early-stop")
+    parser.add_argument("--token-budget", type=int, default=None, help="max API tokens to spend per document")
+    parser.add_argument("--predictor", default=None,
+                        help="score with this local model (see predictors.py) instead of the API, e.g. to pre-screen")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print the per-word match log")
+    args = parser.parse_args(argv)
+
+    options = {
+        "max_sentences": args.max_sentences or None,
+        "concurrency": args.concurrency,
+        "speculative_words": args.speculative_words,
+        "context_policy": args.context_policy,
+        "time_limit": args.time_limit,
+        "verbose": args.verbose,
+        "sampling": args.sampling,
+        "early_stop": args.early_stop,
+        "confidence": args.confidence,
+        "token_budget": args.token_budget,
+    }
+    # All workers share the on-disk prediction cache; SQLite handles the concurrent writers.
+    run_batch(args.source, args.output, args.workers, options, predictor_path=args.predictor)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+import argparse
+import contextlib
+import http.client
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import openai
+
+import isitllm
+import scoring_server
+from benchmark_texts import BENCHMARK_TEXTS
+from fake_openai_server import FakeCompletionsModel, start_server
+from prediction_cache import MemoryCacheTier, PredictionCache, TieredCache
+
+# Runs the scoring paths against a local FakeCompletionsServer so throughput
+# can be compared across commits without touching the real API.
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def cache_bytes_on_disk(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal", path + "-shm") if os.path.exists(p))
+
+
+@contextlib.contextmanager
+def timed_predictions(latencies):
+    """Record the wall time of every isitllm._nano_complete call in the block.
+
+    That is the cached API path behind nano_next_word and nano_continue (and so
+    llm_or_human, rank_models and StreamingScorer). Cache hits go to
+    latencies["hit"], every other call to latencies["miss"].
+    """
+    lock = threading.Lock()
+    original = isitllm._nano_complete
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        result = original(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies["hit" if result[1].get("cached") else "miss"].append(elapsed)
+        return result
+
+    isitllm._nano_complete = timed
+    try:
+        yield
+    finally:
+        isitllm._nano_complete = original
+
+
+def realtime_chunks(text, chunk_words):
+    """Split text the way the realtime client receives it: a few seconds of speech per flush."""
+    words = text.split()
+    return [" ".join(words[i:i + chunk_words]) for i in range(0, len(words), chunk_words)]
+
+
+def run_scenario(scenario, texts, options):
+    latencies = {"hit": [], "miss": []}
+    predictions = 0
+    start = time.perf_counter()
+    with timed_predictions(latencies):
+        for text in texts.values():
+            if scenario == "models":
+                # One rank_models pass over every candidate; compare its wall time with a "text" pass.
+                stats = {}
+                isitllm.rank_models(text, options["models"], max_sentences=options["max_sentences"],
+                                    concurrency=options["concurrency"], context_policy=options["context_policy"],
+                                    time_limit=None, stats=stats, verbose=False)
+                predictions += sum(c["predictions"] for c in stats["models"].values())
+                continue
+            if scenario == "realtime":
+                # Same path as RealtimeLLMCheck: a StreamingScorer fed one flush worth of words at a time.
+                scorer = isitllm.StreamingScorer(context_policy=options["context_policy"] or "words:200",
+                                                 concurrency=options["concurrency"])
+                for chunk in realtime_chunks(text, options["chunk_words"]):
+                    scorer.feed_text(chunk)
+                    predictions += scorer.score_pending()[1]
+                continue
+            stats = {}
+            isitllm.llm_or_human(
+                text,
+                max_sentences=options["max_sentences"],
+                concurrency=options["concurrency"],
+                speculative_words=options["speculative_words"],
+                context_policy=options["context_policy"],
+                time_limit=None,
+                stats=stats,
+                verbose=False,
+                sampling=options["sampling"],
+                early_stop=options["early_stop"],
+            )
+            predictions += stats.get("predictions", 0)
+    elapsed = time.perf_counter() - start
+    # Latency percentiles cover the calls that missed the cache; hits are reported on their own.
+    return {
+        "predictions": predictions,
+        "cache_lookups": len(latencies["hit"]) + len(latencies["miss"]),
+        "elapsed_seconds": elapsed,
+        "words_per_second": predictions / elapsed if elapsed else 0.0,
+        "latency_p50_ms": percentile(latencies["miss"], 50) * 1000,
+        "latency_p95_ms": percentile(latencies["miss"], 95) * 1000,
+        "latency_p99_ms": percentile(latencies["miss"], 99) * 1000,
+        "hit_latency_p50_ms": percentile(latencies["hit"], 50) * 1000,
+    }
+
+
+def run_benchmark(options):
+    server = start_server(
+        model=FakeCompletionsModel(match_rate=options["match_rate"]),
+        latency=options["latency"],
+        jitter=options["jitter"],
+        error_rate=options["error_rate"],
+        seed=options["seed"],
+    )
+    openai.base_url = server.base_url
+    openai.api_key = "fake-key"
+
+    results = []
+    original_cache = isitllm.nano_cache
+    try:
+        for scenario in options["scenarios"]:
+            with tempfile.TemporaryDirectory() as tmp:
+                cache_path = os.path.join(tmp, "bench_cache.sqlite3")
+                isitllm.nano_cache = TieredCache(PredictionCache(cache_path), MemoryCacheTier())
+                for pass_name in ("cold", "warm")[:options["passes"]]:
+                    before_stats = isitllm.cache_stats()
+                    before_bytes = cache_bytes_on_disk(cache_path)
+                    before_requests = server.requests
+                    result = run_scenario(scenario, BENCHMARK_TEXTS, options)
+                    after_stats = isitllm.cache_stats()
+                    hits = (after_stats["hits"] - before_stats["hits"]
+                            + after_stats["store_hits"] - before_stats["store_hits"])
+                    lookups = (after_stats["hits"] + after_stats["misses"]
+                               - before_stats["hits"] - before_stats["misses"])
+                    result.update({
+                        "scenario": scenario,
+                        "pass": pass_name,
+                        "upstream_calls": server.requests - before_requests,
+                        "cache_hit_rate": hits / lookups if lookups else 0.0,
+                        "cache_bytes_written": cache_bytes_on_disk(cache_path) - before_bytes,
+                        # ru_maxrss is the peak of the whole process so far, not of this scenario alone.
+                        "peak_rss_mb_cumulative": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                    })
+                    results.append(result)
+                isitllm.nano_cache.store.close()
+    finally:
+        isitllm.nano_cache = original_cache
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def _load_client(host, port, session_texts, chunk_words, latencies, errors, lock):
+    """One simulated caller: a session on the scoring server, fed and scored one chunk at a time."""
+    conn = http.client.HTTPConnection(host, port, timeout=60)  # one keep-alive connection per caller
+
+    def call(method, path, payload=None):
+        body = json.dumps(payload or {})
+        start = time.perf_counter()
+        conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        data = json.loads(response.read())
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            if response.status >= 400:
+                errors.append(data.get("error", response.status))
+        return data
+
+    words = 0
+    try:
+        session_id = call("POST", "/sessions")["session_id"]
+        for text in session_texts:
+            for chunk in realtime_chunks(text, chunk_words):
+                words += call("POST", f"/sessions/{session_id}/text", {"text": chunk, "score": True})["segment_words"]
+        call("DELETE", f"/sessions/{session_id}")
+    except Exception as e:
+        with lock:
+            errors.append(str(e))
+    finally:
+        conn.close()
+    return words
+
+
+def run_load_test(options):
+    """Drive a ScoringServer with many concurrent sessions, all backed by one fake upstream server."""
+    upstream = start_server(
+        model=FakeCompletionsModel(match_rate=options["match_rate"]),
+        latency=options["latency"],
+        jitter=options["jitter"],
+        error_rate=options["error_rate"],
+        seed=options["seed"],
+    )
+    openai.base_url = upstream.base_url
+    openai.api_key = "fake-key"
+    server = scoring_server.start_server(max_sessions=options["load_sessions"],
+                                         concurrency=options["concurrency"])
+    host, port = server.server_address[:2]
+
+    original_cache = isitllm.nano_cache
+    latencies, errors, lock = [], [], threading.Lock()
+    texts = list(BENCHMARK_TEXTS.values())
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            isitllm.nano_cache = TieredCache(PredictionCache(os.path.join(tmp, "bench_cache.sqlite3")),
+                                             MemoryCacheTier())
+            results = [0] * options["load_sessions"]
+
+            def client(i):
+                # Rotate the texts so sessions overlap partly, as callers reading similar material would.
+                session_texts = texts[i % len(texts):] + texts[:i % len(texts)]
+                results[i] = _load_client(host, port, session_texts, options["chunk_words"], latencies, errors, lock)
+
+            start = time.perf_counter()
+            threads = [threading.Thread(target=client, args=(i,)) for i in range(options["load_sessions"])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            cache = isitllm.cache_stats()
+            isitllm.nano_cache.store.close()
+    finally:
+        isitllm.nano_cache = original_cache
+        server.shutdown()
+        server.server_close()
+        upstream.shutdown()
+        upstream.server_close()
+
+    lookups = cache["hits"] + cache["misses"]
+    return {
+        "sessions": options["load_sessions"],
+        "words": sum(results),
+        "requests": len(latencies),
+        "errors": len(errors),
+        "upstream_requests": upstream.requests,
+        "elapsed_seconds": elapsed,
+        "words_per_second": sum(results) / elapsed if elapsed else 0.0,
+        "request_p50_ms": percentile(latencies, 50) * 1000,
+        "request_p95_ms": percentile(latencies, 95) * 1000,
+        "request_p99_ms": percentile(latencies, 99) * 1000,
+        "cache_hit_rate": (cache["hits"] + cache["store_hits"]) / lookups if lookups else 0.0,
+    }
+
+
+def print_load_results(r):
+    print(f"{r['sessions']} sessions: {r['words']} words in {r['elapsed_seconds']:.1f}s "
+          f"({r['words_per_second']:.1f} words/s), {r['requests']} requests ({r['errors']} errors), "
+          f"{r['upstream_requests']} upstream calls")
+    print(f"request latency p50 {r['request_p50_ms']:.1f} ms, p95 {r['request_p95_ms']:.1f} ms, "
+          f"p99 {r['request_p99_ms']:.1f} ms; shared cache hit rate {r['cache_hit_rate']:.1%}")
+
+
+def measure_import_time(module="isitllm", runs=5):
+    """Import module in fresh interpreters; return (best import time in ms, files it created in the cwd)."""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    env = dict(os.environ, PYTHONPATH=repo_dir + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, "-c", code], cwd=tmp, env=env,
+                                 capture_output=True, text=True, check=True)
+            timings.append(float(out.stdout.strip().splitlines()[-1]))
+        created = sorted(os.listdir(tmp))
+    return min(timings), created
+
+
+def print_results(results):
+    header = (f"{'scenario':<10}{'pass':<6}{'words':>7}{'calls':>7}{'words/s':>10}"
+              f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'hit p50':>9}{'hit rate':>10}{'cache B':>10}{'RSS MB*':>9}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<10}{r['pass']:<6}{r['predictions']:>7}{r['upstream_calls']:>7}"
+              f"{r['words_per_second']:>10.1f}{r['latency_p50_ms']:>9.2f}{r['latency_p95_ms']:>9.2f}"
+              f"{r['latency_p99_ms']:>9.2f}{r['hit_latency_p50_ms']:>9.2f}{r['cache_hit_rate']:>10.1%}"
+              f"{r['cache_bytes_written']:>10}{r['peak_rss_mb_cumulative']:>9.1f}")
+    print("calls: requests the fake server received. p50/p95/p99: prediction calls that missed the cache; "
+          "hit p50: cache hits.")
+    print("* peak RSS of the whole benchmark process up to the end of that pass (cumulative, not per scenario).")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark llm_or_human against a local fake completions server.")
+    parser.add_argument("--scenarios", default="text,realtime", help="comma-separated: text, realtime, models")
+    parser.add_argument("--models", default="gpt-4.1-nano,gpt-4.1-mini,gpt-4o-mini",
+                        help="comma-separated candidates for the models scenario")
+    parser.add_argument("--passes", type=int, choices=(1, 2), default=2, help="1 = cold cache only, 2 = cold + warm")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake server latency per request (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="fake server latency jitter (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake requests answered with 429")
+    parser.add_argument("--match-rate", type=float, default=0.5, help="share of positions the fake model gets right")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--speculative-words", type=int, default=0)
+    parser.add_argument("--context-policy", default=None)
+    parser.add_argument("--max-sentences", type=int, default=0, help="sentences per text; 0 for all")
+    parser.add_argument("--sampling", choices=("head", "spread"), default="head", help="text scenario sampling")
+    parser.add_argument("--early-stop", default=None, help="text scenario early-stop rule, e.g. threshold:30")
+    parser.add_argument("--chunk-words", type=int, default=12, help="words per realtime flush")
+    parser.add_argument("--load-sessions", type=int, default=0,
+                        help="instead of the scenarios, load-test scoring_server with this many concurrent sessions")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    parser.add_argument("--import-budget-ms", type=float, default=None,
+                        help="only check that 'import isitllm' is side-effect free and faster than this; "
+                             "exits non-zero otherwise")
+    args = parser.parse_args(argv)
+
+    if args.import_budget_ms is not None:
+        import_ms, created = measure_import_time()
+        print(f"import isitllm: {import_ms:.1f} ms (budget {args.import_budget_ms:.0f} ms)")
+        if created:
+            print(f"import isitllm created files in the working directory: {created}")
+        if import_ms > args.import_budget_ms or created:
+            sys.exit(1)
+        return
+
+    options = {
+        "scenarios": [s.strip() for s in args.scenarios.split(",") if s.strip()],
+        "passes": args.passes,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "match_rate": args.match_rate,
+        "seed": args.seed,
+        "concurrency": args.concurrency,
+        "speculative_words": args.speculative_words,
+        "context_policy": args.context_policy,
+        "max_sentences": args.max_sentences or None,
+        "chunk_words": args.chunk_words,
+        "sampling": args.sampling,
+        "early_stop": args.early_stop,
+        "load_sessions": args.load_sessions,
+        "models": [m.strip() for m in args.models.split(",") if m.strip()],
+    }
+    if args.load_sessions:
+        results = run_load_test(options)
+        print_load_results(results)
+    else:
+        results = run_benchmark(options)
+        print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"options": options, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
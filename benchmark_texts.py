@@ -0,0 +1,47 @@
+# Fixed texts for the KITT Scale benchmarks and the default Hawking sample.
+# The benchmark harness and the fake completions server both use these, so
+# runs stay comparable from one commit to the next.
+
+DEFAULT_AUTHOR_NAME = "Stephen Hawking"
+DEFAULT_HAWKING_QUOTE = (
+    "IF you remember every word in this book, your memory will have "
+    "recorded about two million pieces of information: the order in your "
+    "brain will have increased by about two million units. However, while "
+    "you have been reading the book, you will have converted at least a "
+    "thousand calories of ordered energy, in the form of food, into "
+    "disordered energy, in the form of heat that you lose to the air around "
+    "you by convection and sweat. This will increase the disorder of the "
+    "universe by about twenty million million million million units - or "
+    "about ten million million million times the increase in order in your "
+    "brain - and that's if you remember everything in this book."
+)
+
+BENCHMARK_TEXTS = {
+    "James Joyce": (
+        "riverrun, past Eve and Adam's, from swerve of shore to bend of bay, brings us "
+        "by a commodius vicus of recirculation back to Howth Castle and Environs. "
+        "Sir Tristram, violer d'amores, fr'over the short sea, had passencore "
+        "rearrived from North Armorica on this side the scraggy isthmus of Europe "
+        "Minor to wielderfight his penisolate war."
+    ),
+    "KITT": (
+        "I am the voice of Knight Industries Two Thousand's microprocessor. "
+        "K-I-T-T for easy reference, KITT if you prefer. "
+        "My primary function is the protection of human life. "
+        "I cannot allow you to do anything that would put you in danger, Michael."
+    ),
+    "Al Gore": (
+        "I have a purpose here today. It is a purpose I have tried to serve for many years. "
+        "I have prayed that God would show me a way to accomplish it. "
+        "We, the human species, are confronting a planetary emergency. "
+        "But there is hopeful news as well: we have the ability to solve this crisis."
+    ),
+    "Elizabeth Holmes": (
+        "Elizabeth Holmes is an American former biotechnology entrepreneur. "
+        "She founded the blood-testing company Theranos in 2003 at the age of nineteen, "
+        "after dropping out of Stanford University. "
+        "The company claimed its devices could run a wide range of tests from a few drops of blood. "
+        "Those claims later proved to be false, and she was convicted of fraud in 2022."
+    ),
+    DEFAULT_AUTHOR_NAME: DEFAULT_HAWKING_QUOTE,
+}
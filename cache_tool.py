@@ -0,0 +1,317 @@
+import argparse
+import gzip
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from isitllm import CACHE_DB
+from prediction_cache import PredictionCache
+
+# Share, prune and pre-fill prediction caches across machines.
+#
+# A cache is either a SQLite database (isitllm's nano_next_word_cache.sqlite3)
+# or an export file: JSON lines, gzip-compressed when the name ends in .gz.
+# The first line is a header naming the format and its version; every other
+# line is one entry:
+#
+#   {"format": "isitllm-prediction-cache", "version": 1, "created_at": ..., "entries": N}
+#   {"model": "gpt-4.1-nano", "key": "<sha256 hex>", "word": "the", "usage": [12, 1, 13], "created_at": ...}
+#
+# Exports are plain data, so unlike the old pickle cache they are safe to load
+# from another host; malformed entries are skipped, and a file with another
+# format or a newer version is refused. Keys are the SHA-256 of the full
+# prompt, so entries from any machine are valid wherever the model is the
+# same. Merging keeps one entry per (model, key), the oldest.
+
+FORMAT_NAME = "isitllm-prediction-cache"
+FORMAT_VERSION = 1
+EXPORT_SUFFIXES = (".jsonl", ".jsonl.gz")
+_SQLITE_MAGIC = b"SQLite format 3\x00"
+
+
+def is_export(path):
+    """True if path names an export file rather than a SQLite cache."""
+    if path.endswith(EXPORT_SUFFIXES):
+        return True
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(_SQLITE_MAGIC)) != _SQLITE_MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def _open_text(path, mode, compressed=None):
+    if compressed if compressed is not None else path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def write_export(path, rows):
+    """Write rows shaped like PredictionCache.iter_rows() to an export file; returns the entry count.
+
+    The file is written next to path and renamed into place, so readers
+    never see a half-written export.
+    """
+    rows = list(rows)
+    tmp_path = f"{path}.tmp"
+    with _open_text(tmp_path, "w", compressed=path.endswith(".gz")) as f:
+        header = {"format": FORMAT_NAME, "version": FORMAT_VERSION, "created_at": time.time(), "entries": len(rows)}
+        f.write(json.dumps(header) + "\n")
+        for model, key, word, prompt_tokens, completion_tokens, total_tokens, created_at in rows:
+            f.write(json.dumps({"model": model, "key": key.hex(), "word": word,
+                                "usage": [prompt_tokens, completion_tokens, total_tokens],
+                                "created_at": created_at}, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+def _parse_entry(entry):
+    key = bytes.fromhex(entry["key"])
+    if len(key) != 32:
+        raise ValueError(f"key is {len(key)} bytes, not 32")
+    model, word = entry["model"], entry["word"]
+    if not isinstance(model, str) or not isinstance(word, str):
+        raise ValueError("model and word must be strings")
+    prompt_tokens, completion_tokens, total_tokens = (int(n) for n in entry["usage"])
+    return model, key, word, prompt_tokens, completion_tokens, total_tokens, float(entry["created_at"])
+
+
+def read_export(path, models=None, since=None):
+    """Yield the entries of an export file as iter_rows() tuples, filtered like iter_rows().
+
+    Raises ValueError if the file is not an export of a supported version.
+    """
+    with _open_text(path, "r") as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get("format") != FORMAT_NAME:
+            raise ValueError(f"{path} is not a prediction cache export")
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported export version {header.get('version')!r}")
+        entries = 0
+        for line_no, line in enumerate(f, 2):
+            if not line.strip():
+                continue
+            entries += 1
+            try:
+                row = _parse_entry(json.loads(line))
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                print(f"Skipping malformed entry on line {line_no} of {path}: {e}")
+                continue
+            if models and row[0] not in models:
+                continue
+            if since is not None and row[6] < since:
+                continue
+            yield row
+        if entries != header.get("entries", entries):
+            print(f"Warning: {path} has {entries} entries but its header lists {header['entries']}; "
+                  f"it may be truncated.")
+
+
+def iter_cache_rows(path, models=None, since=None):
+    """Rows of a SQLite cache or an export file, whichever path is."""
+    if is_export(path):
+        yield from read_export(path, models, since)
+        return
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No such cache: {path}")
+    cache = PredictionCache(path)
+    try:
+        yield from cache.iter_rows(models, since)
+    finally:
+        cache.close()
+
+
+def merge(output, inputs, models=None, since=None):
+    """Merge caches into output (a SQLite cache, created if needed, or an export file).
+
+    Returns (entries read, entries in output).
+    """
+    read = 0
+
+    def counted(rows):
+        nonlocal read
+        for row in rows:
+            read += 1
+            yield row
+
+    if not is_export(output):
+        cache = PredictionCache(output)
+        try:
+            for path in inputs:
+                cache.merge_rows(counted(iter_cache_rows(path, models, since)))
+            return read, len(cache)
+        finally:
+            cache.close()
+    # Deduplicate through a scratch database, then write the export in (model, key) order.
+    with tempfile.TemporaryDirectory() as scratch:
+        cache = PredictionCache(os.path.join(scratch, "merge.sqlite3"))
+        try:
+            if os.path.exists(output):
+                cache.merge_rows(iter_cache_rows(output))  # filters apply to the inputs only
+            for path in inputs:
+                cache.merge_rows(counted(iter_cache_rows(path, models, since)))
+            return read, write_export(output, cache.iter_rows())
+        finally:
+            cache.close()
+
+
+def _since(max_age_days):
+    return time.time() - max_age_days * 86400 if max_age_days is not None else None
+
+
+def corpus_texts(sources, include_benchmarks):
+    """(name, text) for each document of sources, plus the benchmark texts (with the Hawking sample) if asked."""
+    if include_benchmarks:
+        from benchmark_texts import BENCHMARK_TEXTS
+
+        yield from BENCHMARK_TEXTS.items()
+    from batch_score import iter_documents
+
+    for source in sources or ():
+        yield from iter_documents(source)
+
+
+def warm(texts, context_policies=(None,), max_sentences=None, model=None, concurrency=16, dry_run=False):
+    """Fill the prediction cache with every next-word prompt of texts, for each context policy.
+
+    Prompts are keyed and deduplicated up front (see isitllm.PromptTable),
+    only those not cached yet are sent, and they go out together from a
+    pool of concurrency threads, paced by isitllm's rate limiter. Returns a
+    dict of counts: positions, unique, cached, fetched, failed, tokens.
+    """
+    import isitllm
+
+    isitllm.init()
+    model = model or isitllm.MODEL
+    store = isitllm.get_cache().store
+    jobs = {}
+    positions = 0
+    for text in texts:
+        sentences = isitllm.split_sentences(text)[:max_sentences]
+        for policy in context_policies:
+            table = isitllm.PromptTable(sentences, policy)
+            positions += len(table)
+            for i, key in enumerate(table.keys):
+                if key not in jobs:
+                    jobs[key] = partial(table.full_prompt, i)
+    unique = len(jobs)
+    jobs = {key: prompt for key, prompt in jobs.items() if store.get(key, model) is None}
+    counts = {"positions": positions, "unique": unique, "cached": unique - len(jobs), "fetched": 0, "failed": 0,
+              "tokens": 0}
+    if dry_run or not jobs:
+        return counts
+    # An explicit model always goes to the API, even with a local predictor configured.
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for word, usage in executor.map(lambda job: isitllm.nano_next_word(job[1], model=model, key=job[0]),
+                                        jobs.items()):
+            if "error" in usage:
+                counts["failed"] += 1
+            elif usage.get("cached"):
+                counts["cached"] += 1  # filled by another writer since the check above
+            else:
+                counts["fetched"] += 1
+                counts["tokens"] += usage.get("total_tokens", 0)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export, merge, compact and pre-fill next-word prediction caches.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_filters(command):
+        command.add_argument("--model", action="append", dest="models", help="only this model (repeatable)")
+        command.add_argument("--max-age", type=float, default=None, metavar="DAYS",
+                             help="only entries created in the last DAYS days")
+
+    export = commands.add_parser("export", help="write a cache, or the filtered part of it, to an export file")
+    export.add_argument("cache", nargs="?", default=CACHE_DB)
+    export.add_argument("-o", "--output", default="prediction_cache.jsonl.gz")
+    add_filters(export)
+    merge_parser = commands.add_parser("merge", help="merge caches and exports into one, keeping one entry per key")
+    merge_parser.add_argument("output", help="SQLite cache (created if missing) or .jsonl[.gz] export")
+    merge_parser.add_argument("inputs", nargs="+", help="SQLite caches and/or export files")
+    add_filters(merge_parser)
+    compact = commands.add_parser("compact", help="drop entries from a SQLite cache and reclaim the space")
+    compact.add_argument("cache", nargs="?", default=CACHE_DB)
+    compact.add_argument("--keep-model", action="append", help="drop every model but these (repeatable)")
+    compact.add_argument("--drop-model", action="append", help="drop this model (repeatable)")
+    compact.add_argument("--max-age", type=float, default=None, metavar="DAYS",
+                         help="drop entries older than DAYS days")
+    info = commands.add_parser("info", help="entries per model in a cache or export")
+    info.add_argument("cache", nargs="?", default=CACHE_DB)
+    warm_parser = commands.add_parser("warm", help="pre-fill the local cache for a known corpus")
+    warm_parser.add_argument("sources", nargs="*", help="text files, JSONL corpora or directories")
+    warm_parser.add_argument("--benchmarks", action="store_true",
+                             help="include the KITT Scale benchmark texts (the default without sources)")
+    warm_parser.add_argument("--context-policy", action="append", dest="context_policies",
+                             help="policy to warm prompts for (repeatable); default: full and words:200, "
+                                  "as used by isitllm and the realtime scorer")
+    warm_parser.add_argument("--max-sentences", type=int, default=0, help="sentences per document; 0 for all")
+    warm_parser.add_argument("--model", default=None)
+    warm_parser.add_argument("--concurrency", type=int, default=16)
+    warm_parser.add_argument("--dry-run", action="store_true", help="count the calls needed without making them")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "export":
+            count = write_export(args.output, iter_cache_rows(args.cache, args.models, _since(args.max_age)))
+            print(f"Exported {count} entries from {args.cache} to {args.output} "
+                  f"({os.path.getsize(args.output)} bytes).")
+        elif args.command == "merge":
+            read, total = merge(args.output, args.inputs, args.models, _since(args.max_age))
+            print(f"Merged {read} entries into {args.output}, which now holds {total}.")
+        elif args.command == "compact":
+            if is_export(args.cache):
+                print(f"{args.cache} is an export; compact a SQLite cache, or filter with merge.")
+                return
+            if not os.path.exists(args.cache):
+                raise FileNotFoundError(f"No such cache: {args.cache}")
+            cache = PredictionCache(args.cache)
+            size = os.path.getsize(args.cache)
+            deleted = cache.delete(args.drop_model, _since(args.max_age), args.keep_model)
+            cache.vacuum()
+            remaining = len(cache)
+            cache.close()
+            print(f"Deleted {deleted} entries, {remaining} left; {size} -> {os.path.getsize(args.cache)} bytes.")
+        elif args.command == "info":
+            if is_export(args.cache):
+                summary = {}
+                for model, _, _, _, _, _, created_at in read_export(args.cache):
+                    count, oldest, newest = summary.get(model, (0, created_at, created_at))
+                    summary[model] = (count + 1, min(oldest, created_at), max(newest, created_at))
+            elif os.path.exists(args.cache):
+                cache = PredictionCache(args.cache)
+                summary = cache.model_summary()
+                cache.close()
+            else:
+                raise FileNotFoundError(f"No such cache: {args.cache}")
+            for model, (count, oldest, newest) in sorted(summary.items()):
+                print(f"{model}: {count} entries, "
+                      f"{time.strftime('%Y-%m-%d', time.localtime(oldest))} to "
+                      f"{time.strftime('%Y-%m-%d', time.localtime(newest))}")
+        elif args.command == "warm":
+            import isitllm
+
+            isitllm.init()
+            if not args.dry_run and not isitllm.openai.api_key:
+                print("Error: OPENAI_API_KEY not found. Please set it in your .env file or environment.")
+                return
+            texts = [text for _, text in corpus_texts(args.sources, args.benchmarks or not args.sources)]
+            policies = args.context_policies or [None, "words:200"]
+            start = time.perf_counter()
+            counts = warm(texts, policies, args.max_sentences or None, args.model, args.concurrency, args.dry_run)
+            print(f"{counts['positions']} prompts in {len(texts)} texts, {counts['unique']} unique, "
+                  f"{counts['cached']} already cached; fetched {counts['fetched']} "
+                  f"({counts['failed']} failed, {counts['tokens']} tokens) in {time.perf_counter() - start:.1f}s.")
+    except (OSError, ValueError, EOFError) as e:
+        print(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
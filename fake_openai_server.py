@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmark_texts import BENCHMARK_TEXTS
+
+# Local stand-in for the chat completions endpoint, for benchmarks and load
+# tests. Answers are a deterministic function of the prompt: when the prompt
+# ends inside a known corpus text, the true next word is returned for a fixed
+# share (match_rate) of prompts and a decoy word otherwise. Each model name
+# gets its own deterministic answers, and model_match_rates can give some
+# models a different share, to exercise multi-model ranking.
+
+DECOY_WORDS = ["the", "and", "of", "to", "a", "in", "that", "it"]
+CONTEXT_WORDS = 3
+MULTI_WORD_RE = re.compile(r"What are the next (\d+) words")
+
+
+class FakeCompletionsModel:
+    def __init__(self, corpus_texts=None, match_rate=0.5, model_match_rates=None):
+        self.match_rate = match_rate
+        self.model_match_rates = model_match_rates or {}
+        self._next = {}
+        for text in corpus_texts if corpus_texts is not None else BENCHMARK_TEXTS.values():
+            words = text.split()
+            for i in range(1, len(words)):
+                key = tuple(words[max(0, i - CONTEXT_WORDS):i])
+                self._next.setdefault(key, words[i])
+
+    def next_word(self, prompt_text, model=""):
+        words = prompt_text.split()
+        digest = hashlib.sha256(f"{model}\n{prompt_text}".encode("utf-8")).digest()
+        true_word = self._next.get(tuple(words[-CONTEXT_WORDS:]))
+        if true_word is not None and digest[0] < self.model_match_rates.get(model, self.match_rate) * 256:
+            return true_word
+        return DECOY_WORDS[digest[1] % len(DECOY_WORDS)]
+
+    def complete(self, content, model=""):
+        # Prompts are "<text>\n<instruction>"; the multi-word instruction asks for n words.
+        prompt_text, _, instruction = content.rpartition("\n")
+        match = MULTI_WORD_RE.search(instruction)
+        n_words = int(match.group(1)) if match else 1
+        words = []
+        for _ in range(n_words):
+            # Greedy continuation: each word is the answer for the prompt extended by the previous ones.
+            word = self.next_word(prompt_text, model)
+            words.append(word)
+            prompt_text = f"{prompt_text} {word}"
+        return " ".join(words)
+
+
+class FakeCompletionsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, model=None, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        super().__init__(address, FakeCompletionsHandler)
+        self.model = model or FakeCompletionsModel()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def roll(self):
+        """Return (delay, fail) for one request."""
+        with self._rng_lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return delay, fail
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+
+class FakeCompletionsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        delay, fail = self.server.roll()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            self._send_json(429, {"error": {"message": "Rate limit reached (fake server)", "type": "rate_limit_error"}},
+                            headers=[("Retry-After", "0.1")])
+            return
+
+        content = request["messages"][-1]["content"]
+        text = self.server.model.complete(content, request.get("model", ""))
+        prompt_tokens = (len(content) + 3) // 4
+        completion_tokens = len(text.split())
+        self._send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+
+def start_server(host="127.0.0.1", port=0, **options):
+    """Start a FakeCompletionsServer on a background thread; port 0 picks a free port."""
+    server = FakeCompletionsServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve fake, deterministic chat completions for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform +/- seconds around --latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 429")
+    parser.add_argument("--match-rate", type=float, default=0.5, help="share of corpus positions answered correctly")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server = FakeCompletionsServer(
+        (args.host, args.port),
+        model=FakeCompletionsModel(match_rate=args.match_rate),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    print(f"Fake completions server on {server.base_url} (set OPENAI_BASE_URL to use it)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
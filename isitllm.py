@@ -1,18 +1,42 @@
+import logging
 import os
-import openai
-from dotenv import load_dotenv
 import re
-import pickle
+import sys
+import math
 import hashlib
 import time
-from PIL import Image
-import matplotlib.pyplot as plt
-from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+import threading
+import queue
+from functools import partial
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from metrics import METRICS
+from prediction_cache import MemoryCacheTier, PredictionCache, TieredCache
+from rate_limit import RateLimiter, RetryPolicy, retry_after_seconds
 
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 MODEL = "gpt-4.1-nano"
 
+# Importing this module has no side effects and stays cheap: the openai
+# package, .env loading and the prediction cache are set up on first use
+# (or by calling init() up front), and plotting imports matplotlib only when
+# a plot is drawn.
+openai = None
+_env_loaded = False
+_init_lock = threading.RLock()
+_client = None
+_client_config = None
+_predictor = None  # local predictor used instead of the API; see set_predictor()
+_predictor_resolved = False  # True once set_predictor() ran or ISITLLM_PREDICTOR was checked
+# Keep-alive connections shared by every thread (and scoring session) in the
+# process; None reads ISITLLM_MAX_CONNECTIONS (default 64) once .env is loaded.
+MAX_CONNECTIONS = None
+# Client-side limits for the account's quota (0 = unlimited) and how often a
+# rate-limited or failed request is retried before the prediction is dropped.
+# Built by init() from ISITLLM_RPM / ISITLLM_TPM / ISITLLM_MAX_RETRIES once
+# .env is loaded, unless they were set before that.
+rate_limiter = None
+retry_policy = None
+
 
 def split_sentences(text):
     return [s.strip() for s in re.split(r'(?<=[.!?])\s+', text) if s.strip()]
@@ -22,232 +46,1112 @@ def split_words(text):
     return text.strip().split()
 
 
-CACHE_FILE = "nano_next_word_cache.pkl"
-try:
-    with open(CACHE_FILE, "rb") as f:
-        nano_cache = pickle.load(f)
-except FileNotFoundError:
-    print(f"Cache file {CACHE_FILE} not found. Starting with an empty cache.")
-    nano_cache = {}
-except Exception as e:
-    print(f"Error loading cache file {CACHE_FILE}: {e}. Starting with an empty cache.")
-    nano_cache = {}
+CACHE_DB = "nano_next_word_cache.sqlite3"
+LEGACY_CACHE_FILE = "nano_next_word_cache.pkl"  # pre-SQLite cache, migrated on first run
+nano_cache = None  # opened by get_cache()
+
+
+def _load_env():
+    global _env_loaded
+    with _init_lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _env_loaded = True
+
+
+def get_cache():
+    """Return the prediction cache, opening it (and migrating an old pickle cache) on first use."""
+    global nano_cache
+    if nano_cache is None:
+        with _init_lock:
+            if nano_cache is None:
+                _load_env()
+                # In-memory LRU tier in front of the SQLite cache; 0 disables a limit.
+                nano_cache = TieredCache(
+                    PredictionCache(CACHE_DB, legacy_pickle=LEGACY_CACHE_FILE, legacy_model=MODEL),
+                    MemoryCacheTier(
+                        max_entries=int(os.getenv("ISITLLM_CACHE_MAX_ENTRIES", "100000")),
+                        max_bytes=int(os.getenv("ISITLLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+                    ),
+                )
+    return nano_cache
+
+
+def init():
+    """Load .env, import and configure openai, and open the prediction cache.
+
+    Everything here also happens lazily on the first prediction; calling it
+    explicitly moves that cost to a point of the caller's choosing.
+    """
+    global openai, rate_limiter, retry_policy
+    with _init_lock:
+        _load_env()
+        if rate_limiter is None:
+            rate_limiter = RateLimiter(rpm=int(os.getenv("ISITLLM_RPM", "0")), tpm=int(os.getenv("ISITLLM_TPM", "0")))
+        if retry_policy is None:
+            retry_policy = RetryPolicy(max_retries=int(os.getenv("ISITLLM_MAX_RETRIES", "5")))
+        _current_predictor()
+        if openai is None:
+            import openai as openai_module
+            # Keep a key that was set programmatically before init (e.g. by the benchmark).
+            openai_module.api_key = openai_module.api_key or os.getenv("OPENAI_API_KEY")
+            openai = openai_module
+    get_cache()
+    return openai
+
+
+def set_predictor(predictor):
+    """Route nano_next_word / nano_continue to a local predictor instead of the API.
+
+    predictor is a predictors.Predictor (or anything with the same interface),
+    a path to a saved model, or None to go back to the API. Setting the
+    ISITLLM_PREDICTOR environment variable to a model path does the same on
+    init().
+    """
+    global _predictor, _predictor_resolved
+    if isinstance(predictor, str):
+        from predictors import load_predictor
+        predictor = load_predictor(predictor)
+    _predictor = predictor
+    _predictor_resolved = True
+    return predictor
+
+
+def _current_predictor():
+    """The local predictor in use, or None for the API; reads ISITLLM_PREDICTOR (and .env) the first time.
+
+    Called before a backend is chosen, so a run configured for a local model
+    never sends its first prediction to the API.
+    """
+    if not _predictor_resolved:
+        with _init_lock:
+            if not _predictor_resolved:
+                _load_env()
+                set_predictor(os.getenv("ISITLLM_PREDICTOR") or None)
+    return _predictor
+
+
+def get_client():
+    """Return the process-wide OpenAI client, backed by one pooled keep-alive HTTP connection pool.
+
+    The client follows openai.api_key / openai.base_url, so changing those
+    (as the benchmark does to target the fake server) swaps in a new client.
+    """
+    global _client, _client_config
+    if openai is None:
+        init()
+    config = (openai.api_key, str(openai.base_url) if openai.base_url else None)
+    if _client is None or _client_config != config:
+        with _init_lock:
+            if _client is None or _client_config != config:
+                import httpx
+                max_connections = MAX_CONNECTIONS or int(os.getenv("ISITLLM_MAX_CONNECTIONS", "64"))
+                http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=max_connections,
+                                        max_keepalive_connections=max_connections),
+                    timeout=httpx.Timeout(30.0, connect=5.0),
+                )
+                old_client = _client
+                # Retries are done by _create_with_retries, which also paces every thread through rate_limiter.
+                _client = openai.OpenAI(api_key=config[0], base_url=config[1], http_client=http_client,
+                                        max_retries=0)
+                _client_config = config
+                if old_client is not None:
+                    old_client.close()
+    return _client
+
+
+def cache_stats():
+    """Hit, miss and eviction counters plus size of the in-memory prediction cache tier."""
+    return get_cache().stats()
 
 
 def hash_prompt(prompt):
     return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
 
 
-def save_cache():
+def prompt_digest(prompt):
+    return hashlib.sha256(prompt.encode('utf-8')).digest()
+
+
+def _create_with_retries(prompt, max_tokens, caller, model):
+    """Send one completion request through rate_limiter, retrying 429s, 5xx and connection errors."""
+    if rate_limiter is None or retry_policy is None:
+        init()
+    estimated_tokens = approx_token_count(prompt) + max_tokens
+    attempt = 0
+    while True:
+        waited = rate_limiter.acquire(estimated_tokens)
+        if waited:
+            METRICS.observe("rate_limit_wait_seconds", waited)
+        try:
+            with METRICS.phase("network"):
+                response = get_client().chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=0.0,
+                    stop=None,
+                )
+        except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+            if attempt >= retry_policy.max_retries:
+                raise
+            response = getattr(e, "response", None)
+            retry_after = retry_after_seconds(response.headers if response is not None else None)
+            delay = retry_policy.delay(attempt, retry_after)
+            if isinstance(e, openai.RateLimitError):
+                rate_limiter.pause(delay)
+            METRICS.inc("api_retries_total", caller=caller, error=type(e).__name__)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        usage = response.usage
+        rate_limiter.record(estimated_tokens, usage.total_tokens if usage else estimated_tokens)
+        return response
+
+
+def _nano_complete(prompt, max_tokens, n_words, caller, model=None, key=None):
+    """Cached greedy completion of prompt by model (default MODEL), trimmed to its first n_words words.
+
+    key is prompt_digest(prompt), for callers that already hashed the prompt.
+    With a key, prompt may also be a zero-argument callable returning the
+    prompt; it is then only built on a cache miss.
+    """
+    if openai is None or nano_cache is None:
+        init()
+    model = model or MODEL
+    cache = nano_cache  # the cache this call started with, even if nano_cache is swapped while it waits
+    with METRICS.timer("prediction_seconds", caller=caller):
+        if key is None:
+            with METRICS.phase("hash"):
+                key = prompt_digest(prompt)
+        with METRICS.phase("cache_lookup"):
+            cached = cache.get(key, model)
+        if cached is not None:
+            METRICS.inc("cache_hits_total")
+            word, usage = cached
+            # Marked so callers count only tokens actually spent on API calls.
+            return word, dict(usage, cached=True)
+        METRICS.inc("cache_misses_total")
+        if callable(prompt):
+            prompt = prompt()
+
+        if not openai.api_key:
+            # Logged at debug level: quiet runs stay quiet, and verbose ones print usage_info['error'] per word.
+            logging.debug("OpenAI API key is not set. Cannot make API call.")
+            METRICS.inc("api_errors_total", error="no_api_key")
+            return '', {'error': 'API key not set'}
+
+        try:
+            response = _create_with_retries(prompt, max_tokens, caller, model)
+            text = response.choices[0].message.content.strip()
+            words = " ".join(split_words(text)[:n_words])
+            usage = response.usage.to_dict() if hasattr(response, 'usage') and response.usage else {}
+            METRICS.inc("api_requests_total", caller=caller)
+            METRICS.inc("tokens_total", usage.get('prompt_tokens', 0), kind="prompt")
+            METRICS.inc("tokens_total", usage.get('completion_tokens', 0), kind="completion")
+            cache.put(key, model, words, usage)
+            return words, usage
+        except openai.APIError as e:
+            logging.debug(f"OpenAI API Error in {caller} for prompt '{prompt[:50]}...': {e}")
+            METRICS.inc("api_errors_total", error=type(e).__name__)
+            METRICS.emit("api_error", caller=caller, error=str(e))
+            return '', {'error': str(e)}
+        except Exception as e:
+            logging.debug(f"Unexpected error in {caller} for prompt '{prompt[:50]}...': {e}")
+            METRICS.inc("api_errors_total", error=type(e).__name__)
+            METRICS.emit("api_error", caller=caller, error=str(e))
+            return '', {'error': str(e)}
+
+
+def _local_usage(predictor):
+    METRICS.inc("local_predictions_total", predictor=predictor.name)
+    return {'predictor': predictor.name}
+
+
+def nano_next_word(prompt, model=None, key=None):
+    predictor = _current_predictor() if model is None else None
+    if predictor is not None:
+        prompt_text = (prompt() if callable(prompt) else prompt).rpartition("\n")[0]
+        return predictor.next_word(prompt_text), _local_usage(predictor)
+    return _nano_complete(prompt, max_tokens=2, n_words=1, caller="nano_next_word", model=model, key=key)
+
+
+def nano_continue(prompt_text, n_words):
+    """Ask for the next n_words words after prompt_text; returns (list of words, usage)."""
+    predictor = _current_predictor()
+    if predictor is not None:
+        # Greedy: each word is predicted after the ones before it, as the API would continue.
+        context = split_words(prompt_text)[-predictor.context_words:]
+        words = []
+        for _ in range(n_words):
+            word = predictor.predict_batch([context])[0]
+            words.append(word)
+            context = (context + [word])[-predictor.context_words:]
+        return words, _local_usage(predictor)
+    prompt = f"{prompt_text}\n{CONTINUE_INSTRUCTION.format(n=n_words)}"
+    # Roughly 1.3 tokens per English word; leave headroom so the last word isn't cut off.
+    text, usage = _nano_complete(prompt, max_tokens=2 * n_words + 2, n_words=n_words, caller="nano_continue")
+    return split_words(text), usage
+
+
+INSTRUCTION = "What is the next word in this text? Respond with ONLY the next word and nothing else."
+CONTINUE_INSTRUCTION = ("What are the next {n} words in this text? "
+                        "Respond with ONLY those next words, separated by spaces, and nothing else.")
+MAX_EXECUTION_TIME_SECONDS = 120
+
+
+def approx_token_count(text):
+    """Cheap estimate of how many tokens text costs (about 4 characters per token for English)."""
+    return (len(text) + 3) // 4
+
+
+INSTRUCTION_TOKENS = approx_token_count(INSTRUCTION)
+
+
+def parse_context_policy(policy):
+    """Parse a context policy spec into (kind, limit).
+
+    "full" (or None) sends every earlier sentence and "sentences:N" the last N
+    earlier sentences, each followed by the current sentence up to the word
+    being predicted. "words:N" and "tokens:N" send only the last N words or
+    (approximate) tokens of the text up to that word, wherever the sentence
+    boundaries fall, so run-on text and unpunctuated transcripts stay bounded
+    too. The word just before the prediction is always sent.
+    """
+    if policy in (None, "", "full"):
+        return "full", None
+    kind, _, limit = str(policy).partition(":")
+    if kind not in ("sentences", "words", "tokens") or not limit.isdigit():
+        raise ValueError(f"Unknown context policy {policy!r}; expected 'full', 'sentences:N', 'words:N' or 'tokens:N'.")
+    return kind, int(limit)
+
+
+def _context_for(previous_sentences, kind, limit):
+    # Earlier sentences in front of the current one, for the "full" and "sentences" policies.
+    if kind == "full":
+        return "".join(s + " " for s in previous_sentences)
+    return "".join(s + " " for s in previous_sentences[-limit:] if limit)
+
+
+def _window_start(words, end, kind, limit):
+    """Index where the "words"/"tokens" window ending before words[end] starts; never past end - 1."""
+    if kind == "words":
+        return max(0, end - max(limit, 1))
+    start, budget = end, limit
+    while start > 0:
+        budget -= approx_token_count(words[start - 1] + " ")
+        if budget < 0 and start < end:
+            break
+        start -= 1
+    return start
+
+
+class PromptTable:
+    """Every word position of a text, with its cache key, built without materializing the prompts.
+
+    Position i asks for true_words[i] after prompt_text(i), the text allowed
+    by context_policy up to that word (see parse_context_policy). Keys are
+    computed with one running SHA-256 state per sentence (copied for each
+    word) and, under the "full" policy, one running state for the context,
+    so building the table is linear in the text length instead of quadratic;
+    "words" and "tokens" windows are bounded, so each of their prompts is
+    simply hashed whole. keys[i] is byte-for-byte prompt_digest(full_prompt(i)),
+    so existing cache entries stay valid; the instruction text is part of the
+    hashed prompt and the model is the cache namespace, so changing either
+    never reuses a stale entry. prompt_text() and full_prompt() build the
+    strings on demand, which scoring only needs on a cache miss.
+    """
+
+    def __init__(self, sentences, context_policy=None, instruction=INSTRUCTION):
+        kind, limit = parse_context_policy(context_policy)
+        self.instruction = instruction
+        suffix = f"\n{instruction}".encode("utf-8")
+        self.keys = []
+        self.true_words = []
+        self.prompt_lengths = []  # characters in prompt_text(i), for token estimates
+        self._positions = []  # (sentence slot, word index), or (start, end) into _words for a window policy
+        self._sentences = []  # (context, words) per sentence with positions; context is a string or, for "full", the number of sentences before it
+        self._all_sentences = sentences
+        self._windowed = kind in ("words", "tokens")
+        self._words = []  # every word so far, for the window policies
+        if self._windowed:
+            for sentence in sentences:
+                words = split_words(sentence)
+                first = len(self._words)
+                self._words.extend(words)
+                for end in range(first + 1, len(self._words)):
+                    start = _window_start(self._words, end, kind, limit)
+                    prompt_text = " ".join(self._words[start:end])
+                    self.keys.append(prompt_digest(f"{prompt_text}\n{instruction}"))
+                    self.true_words.append(self._words[end])
+                    self.prompt_lengths.append(len(prompt_text))
+                    self._positions.append((start, end))
+            return
+        context_hash = hashlib.sha256()
+        context_length = 0
+        previous_sentences = []
+        for si, sentence in enumerate(sentences):
+            words = split_words(sentence)
+            if len(words) >= 2:
+                if kind == "full":
+                    context, base = si, context_hash
+                else:
+                    context = _context_for(previous_sentences, kind, limit).lstrip()
+                    context_length = len(context)
+                    base = hashlib.sha256(context.encode("utf-8"))
+                slot = len(self._sentences)
+                self._sentences.append((context, words))
+                prefix = base.copy()
+                length = context_length
+                for wi in range(len(words) - 1):
+                    piece = words[wi] if wi == 0 else " " + words[wi]
+                    prefix.update(piece.encode("utf-8"))
+                    length += len(piece)
+                    full = prefix.copy()
+                    full.update(suffix)
+                    self.keys.append(full.digest())
+                    self.true_words.append(words[wi + 1])
+                    self.prompt_lengths.append(length)
+                    self._positions.append((slot, wi))
+            if kind == "full":
+                # The full context is every earlier sentence plus a space, minus leading whitespace.
+                piece = sentence + " "
+                if not context_length:
+                    piece = piece.lstrip()
+                context_hash.update(piece.encode("utf-8"))
+                context_length += len(piece)
+            else:
+                previous_sentences.append(sentence)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prompt_text(self, i):
+        if self._windowed:
+            start, end = self._positions[i]
+            return " ".join(self._words[start:end])
+        slot, wi = self._positions[i]
+        context, words = self._sentences[slot]
+        if not isinstance(context, str):
+            context = "".join(s + " " for s in self._all_sentences[:context]).lstrip()
+        return context + " ".join(words[:wi + 1])
+
+    def full_prompt(self, i):
+        return f"{self.prompt_text(i)}\n{self.instruction}"
+
+    def continues(self, i, j):
+        """True if prompt_text(j) is prompt_text(i) followed by true_words[i] (compared without building them)."""
+        if self._windowed:
+            return self._positions[j] == (self._positions[i][0], self._positions[i][1] + 1)
+        slot, wi = self._positions[i]
+        return self._positions[j] == (slot, wi + 1)
+
+    def tail_words(self, i, k):
+        """The last k words of prompt_text(i), without building it (what a local predictor needs)."""
+        if self._windowed:
+            start, end = self._positions[i]
+            return self._words[max(start, end - k):end]
+        slot, wi = self._positions[i]
+        context, words = self._sentences[slot]
+        tail = words[max(0, wi + 1 - k):wi + 1]
+        if len(tail) < k:
+            if isinstance(context, str):
+                earlier = split_words(context)
+            else:
+                earlier = []
+                for si in range(context - 1, -1, -1):
+                    earlier[:0] = split_words(self._all_sentences[si])
+                    if len(earlier) >= k - len(tail):
+                        break
+            tail = earlier[max(0, len(earlier) - (k - len(tail))):] + tail
+        return tail
+
+
+def spread_order(positions):
+    """Reorder positions so that every prefix is spread evenly across the document.
+
+    Uses the bit-reversal (van der Corput) permutation of the indices: the
+    first few positions fall at the start, middle and quarters of the text,
+    and each later one lands in the largest gap left. Deterministic, so the
+    same text always samples the same positions.
+    """
+    n = len(positions)
+    bits = max(1, (n - 1).bit_length())
+    order = []
+    for i in range(1 << bits):
+        j = int(format(i, f"0{bits}b")[::-1], 2)
+        if j < n:
+            order.append(positions[j])
+    return order
+
+
+def wilson_interval(successes, trials, z=1.96):
+    """Wilson score interval for a binomial proportion, as (low, high) fractions."""
+    if not trials:
+        return 0.0, 1.0
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    centre = (p + z * z / (2 * trials)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, centre - half_width), min(1.0, centre + half_width)
+
+
+def confidence_sequence(successes, trials, alpha=0.05, rho=2.5):
+    """Match-rate interval that holds at every number of trials at once, as (low, high) fractions.
+
+    A plain interval such as wilson_interval() is only valid at one sample
+    size fixed in advance; checking it after every prediction and stopping
+    at the first clear result makes it wrong far more often than alpha. This
+    is Robbins' normal-mixture confidence sequence for 1/2-sub-Gaussian
+    (here Bernoulli) observations, with alpha split over the two sides: the
+    chance that the true rate ever leaves the interval, over the whole run,
+    is at most alpha. rho tunes where it is tightest (2.5 suits runs of tens
+    to a few hundred predictions).
+    """
+    if not trials:
+        return 0.0, 1.0
+    variance = trials / 4
+    radius = math.sqrt((variance + rho) * (math.log((variance + rho) / rho) + 2 * math.log(2 / alpha))) / trials
+    p = successes / trials
+    return max(0.0, p - radius), min(1.0, p + radius)
+
+
+def parse_early_stop(rule, confidence=0.95):
+    """Parse an early-stopping rule into (kind, value, alpha).
+
+    Both rules are checked after every prediction against
+    confidence_sequence() at the given confidence, so the rate of wrong
+    calls stays at most 1 - confidence however often they are checked.
+    "precision:P" stops once that interval on the match rate is at most
+    +/- P percentage points wide; "threshold:T" stops once it lies entirely
+    above or below a T% match rate, where the LLM/human verdict for that
+    cutoff is wrong with probability at most (1 - confidence) / 2. None
+    disables early stopping.
+    """
+    if rule in (None, ""):
+        return None, None, None
+    kind, _, value = str(rule).partition(":")
     try:
-        with open(CACHE_FILE, "wb") as f:
-            pickle.dump(nano_cache, f)
-    except Exception as e:
-        print(f"Error saving cache file {CACHE_FILE}: {e}")
+        value = float(value)
+    except ValueError:
+        value = None
+    if kind not in ("precision", "threshold") or value is None or not 0 < value < 100:
+        raise ValueError(f"Unknown early-stop rule {rule!r}; expected 'precision:P' or 'threshold:T' (percent).")
+    if not 0 < confidence < 1:
+        raise ValueError(f"confidence must be between 0 and 1, not {confidence!r}")
+    return kind, value / 100, 1 - confidence
+
+
+def _early_stop_reached(correct, total, kind, value, alpha):
+    low, high = confidence_sequence(correct, total, alpha)
+    if kind == "precision":
+        return (high - low) / 2 <= value
+    return low > value or high < value
 
 
-def nano_next_word(prompt):
-    h = hash_prompt(prompt)
-    if h in nano_cache:
-        return nano_cache[h]['word'], nano_cache[h].get('usage', {})
+def _words_match(predicted_word, true_word):
+    return predicted_word.lower().strip() == true_word.lower().strip()
 
-    if not openai.api_key:
-        print("OpenAI API key is not set. Cannot make API call.")
-        return '', {'error': 'API key not set'}
 
+def _report_prediction(prompt_text, true_next_word, predicted_next_word, usage_info, verbose=True):
+    """Print the match log for one position (when verbose) and return (is_match, api_tokens).
+
+    A failed call (usage_info has an 'error') is not a prediction: callers
+    leave it out of the score instead of counting it as a miss.
+    """
+    with METRICS.phase("compare"):
+        is_match = _words_match(predicted_next_word, true_next_word)
+    api_tokens = 0
+    if usage_info and not any(usage_info.get(flag) for flag in ('error', 'speculated', 'cached')):
+        api_tokens = usage_info.get('total_tokens', 0)
+    if usage_info.get('error'):
+        is_match = False
+        METRICS.inc("predictions_failed_total")
+    else:
+        METRICS.inc("predictions_total")
+    if is_match:
+        METRICS.inc("matches_total")
+    if not verbose:
+        return is_match, api_tokens
+
+    print(f"\nEvaluating: [...{prompt_text[-80:]}]")
+    print(f"  True next word:      '{true_next_word}'")
+    print(f"  Predicted next word: '{predicted_next_word}'")
+    print(f"  Match: {is_match}")
+
+    if usage_info.get('speculated'):
+        print(f"  Usage: covered by the previous speculative call.")
+    elif usage_info.get('predictor'):
+        print(f"  Usage: predicted locally by {usage_info['predictor']}.")
+    elif usage_info.get('cached'):
+        print(f"  Usage (cached): no API call, {usage_info.get('total_tokens', 0)} tokens when first fetched.")
+    elif usage_info and not usage_info.get('error'):
+        print(f"  Usage (API call): {usage_info}")
+    elif usage_info.get('error'):
+        print(f"  API call failed or skipped for this word: {usage_info.get('error')}")
+    else:
+        print(f"  Usage (cached): Previous usage info might be in cache if available.")
+    return is_match, api_tokens
+
+
+def _iter_predictions_sequential(jobs, deadline):
+    # jobs are (prompt, key) pairs; see _nano_complete for lazy prompts.
+    for prompt, key in jobs:
+        if time.time() > deadline:
+            return
+        yield nano_next_word(prompt, key=key)
+
+
+def _iter_predictions_concurrent(jobs, deadline, concurrency):
+    # Every prompt is known up front, so submit them all to a bounded pool and
+    # hand the results back in text order.
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    futures = [executor.submit(nano_next_word, prompt, key=key) for prompt, key in jobs]
     try:
-        response = openai.chat.completions.create(
-            model=MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=2,
-            temperature=0.0,
-            stop=None,
-        )
-        text = response.choices[0].message.content.strip()
-        next_word = split_words(text)[0] if text else ''
-        usage = response.usage.to_dict() if hasattr(response, 'usage') and response.usage else {}
-        nano_cache[h] = {'word': next_word, 'usage': usage}
-        save_cache()
-        return next_word, usage
-    except openai.APIError as e:
-        print(f"OpenAI API Error in nano_next_word for prompt '{prompt[:50]}...': {e}")
-        return '', {'error': str(e)}
-    except Exception as e:
-        print(f"Unexpected error in nano_next_word for prompt '{prompt[:50]}...': {e}")
-        return '', {'error': str(e)}
-
-
-def llm_or_human(input_text, max_sentences=4):
-    MAX_EXECUTION_TIME_SECONDS = 120
+        for future in futures:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            try:
+                # An infinite deadline (time_limit=None) means wait as long as it takes.
+                yield future.result(timeout=remaining if remaining != float('inf') else None)
+            except FuturesTimeoutError:
+                return
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _iter_predictions_local(table, order, predictor, deadline, batch_size=1024):
+    # Positions go to the predictor in batches, so a document is one or a few vectorized passes.
+    order = list(order)
+    for start in range(0, len(order), batch_size):
+        if time.time() > deadline:
+            return
+        batch = order[start:start + batch_size]
+        words = predictor.predict_batch([table.tail_words(i, predictor.context_words) for i in batch])
+        for word in words:
+            yield word, _local_usage(predictor)
+
+
+def _speculative_chains(table, order):
+    """Split order into runs where each prompt is the previous prompt plus its true next word."""
+    chains = []
+    for i in order:
+        if chains and table.continues(chains[-1][-1], i):
+            chains[-1].append(i)
+        else:
+            chains.append([i])
+    return chains
+
+
+def _predict_chain_speculative(table, chain, n_words, deadline, stop, spend, emit):
+    # One call drafts the next n_words words. While the draft keeps matching the
+    # true text it also predicts the following positions; the first mismatch
+    # consumes its draft word and the next call starts from the position after it.
+    # Each result is handed to emit as soon as it is known. stop, deadline and
+    # spend (which returns False once the token budget is used up) are checked
+    # before every call, so a consumer that gives up stops the spending too.
+    i = 0
+    while i < len(chain) and time.time() <= deadline and not stop.is_set():
+        draft, usage_info = nano_continue(table.prompt_text(chain[i]), min(n_words, len(chain) - i))
+        if not spend(usage_info):
+            stop.set()
+        if not draft:
+            emit(('', usage_info))
+            i += 1
+            continue
+        for j, predicted_word in enumerate(draft):
+            if i >= len(chain):
+                break
+            emit((predicted_word, usage_info if j == 0 else {'speculated': True}))
+            i += 1
+            if not _words_match(predicted_word, table.true_words[chain[i - 1]]):
+                break
+
+
+def _iter_predictions_speculative(table, order, deadline, concurrency, n_words, token_budget=None):
+    # Chains are independent of each other, so with concurrency > 1 they run on a
+    # pool; results still come back in text order, each as soon as it is drafted.
+    # Closing the generator (the caller stopped early or ran out of budget) stops
+    # every running chain before its next call.
+    chains = _speculative_chains(table, order)
+    stop = threading.Event()
+    spent_lock = threading.Lock()
+    spent = [0]
+
+    def spend(usage_info):
+        if token_budget is None or usage_info.get('cached'):
+            return True
+        with spent_lock:
+            spent[0] += usage_info.get('total_tokens', 0) or 0
+            return spent[0] < token_budget
+
+    done = object()
+    results = [queue.Queue() for _ in chains]
+
+    def run(chain, results):
+        try:
+            _predict_chain_speculative(table, chain, n_words, deadline, stop, spend, results.put)
+        finally:
+            results.put(done)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    for chain, chain_results in zip(chains, results):
+        executor.submit(run, chain, chain_results)
+    try:
+        for chain, chain_results in zip(chains, results):
+            produced = 0
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return
+                try:
+                    result = chain_results.get(timeout=remaining if remaining != float('inf') else None)
+                except queue.Empty:
+                    return
+                if result is done:
+                    break
+                produced += 1
+                yield result
+            if produced < len(chain):
+                return
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def llm_or_human(input_text, max_sentences=4, concurrency=1, speculative_words=0, context_policy=None,
+                 time_limit=MAX_EXECUTION_TIME_SECONDS, stats=None, verbose=True, sampling="head",
+                 early_stop=None, confidence=0.95, min_predictions=10, token_budget=None, predictor=None):
+    """Score how often the model predicts the next word of input_text.
+
+    max_sentences=None scores the whole text. Prompt size is then best kept in
+    check with a context_policy such as "words:200" (see parse_context_policy),
+    and time_limit=None removes the wall-clock cutoff.
+
+    Returns (score_percentage, api_tokens). If a stats dict is passed it is
+    filled with the prediction counts and token usage of the run. verbose=False
+    skips the per-word match log and summary prints; counters, latencies and a
+    "score" event still go to metrics.METRICS.
+
+    With concurrency > 1 the predictions are issued from a pool of that many
+    worker threads; the score, match log and token accounting are the same as
+    the sequential path.
+
+    With speculative_words > 1 each call asks for that many words of
+    continuation and reuses them for the following positions as long as they
+    match the true text, so a new call is only made after a mismatch. With
+    greedy decoding the draft is the model's own continuation, so as long as it
+    answers the multi-word and one-word instructions consistently the score is
+    unchanged while each matching run costs a single call.
+
+    sampling="spread" scores positions from the whole text (max_sentences is
+    ignored) in an order that covers the document evenly from the first call
+    on (see spread_order), instead of reading from the head. It pairs with
+    early_stop (see parse_early_stop): after min_predictions, scoring stops
+    as soon as the confidence sequence at the given confidence (an interval
+    that stays valid however often it is checked) is narrow enough, or clear
+    of the threshold, so clearly human or clearly generated text is
+    settled in far fewer calls. Speculative drafting needs adjacent positions
+    and gains nothing with spread sampling.
+
+    Rate-limited and failed calls are retried (see rate_limit); a position
+    whose call still fails is left out of the score rather than counted as
+    a miss, and reported as 'failed' in stats. token_budget caps the API
+    tokens one call of llm_or_human may spend: scoring stops once it is
+    used up. Calls already in flight still finish, so with concurrency the
+    budget or the time limit can be overshot by up to one call per thread.
+    Speculative chains check the budget, the time limit and whether scoring
+    has stopped before every call; the chains running ahead of the position
+    being scored (one per thread) may still have drafted words that an early
+    stop then leaves unused.
+
+    predictor scores with a local model (see predictors.py) instead of the
+    API, in batched passes and without touching the cache; it defaults to the
+    one given to set_predictor(). Speculative and concurrent options do not
+    apply to local scoring.
+    """
+    if sampling not in ("head", "spread"):
+        raise ValueError(f"Unknown sampling {sampling!r}; expected 'head' or 'spread'.")
+    early_kind, early_value, alpha = parse_early_stop(early_stop, confidence)
     start_time = time.time()
+    deadline = start_time + time_limit if time_limit is not None else float('inf')
     time_limit_reached_flag = False
+    stopped_early = False
+    budget_exhausted = False
+    failed_predictions = 0
 
-    sentences = split_sentences(input_text)
+    with METRICS.phase("prompt_build"):
+        sentences = split_sentences(input_text)
+        table = PromptTable(sentences if sampling == "spread" else sentences[:max_sentences], context_policy)
+        order = spread_order(range(len(table))) if sampling == "spread" else range(len(table))
     if not sentences:
-        print("Input text contains no sentences.")
+        if verbose:
+            print("Input text contains no sentences.")
         return 0.0, 0
 
-    sentences_to_process = sentences[:max_sentences]
     total_predictions = 0
     correct_predictions = 0
     total_tokens_used_api = 0
-    context = ""
+    prompt_tokens_api = 0
+    prompt_tokens_estimated = 0
+    prediction_calls = 0
 
-    try:
-        for si, sentence in enumerate(sentences_to_process):
-            current_time = time.time()
-            if current_time - start_time > MAX_EXECUTION_TIME_SECONDS:
-                print(
-                    f"\nTime limit of {MAX_EXECUTION_TIME_SECONDS} seconds reached during sentence processing. Stopping.")
-                time_limit_reached_flag = True
-                break
-
-            words = split_words(sentence)
-            if len(words) < 2:
-                context += sentence + " "
-                continue
-
-            for wi in range(len(words) - 1):
-                current_time = time.time()
-                if current_time - start_time > MAX_EXECUTION_TIME_SECONDS:
-                    print(
-                        f"\nTime limit of {MAX_EXECUTION_TIME_SECONDS} seconds reached during word processing. Stopping.")
-                    time_limit_reached_flag = True
-                    break
-
-                current_prompt_words = words[:wi + 1]
-                prompt_text = (context + " ".join(current_prompt_words)).strip()
-                if not prompt_text:
-                    continue
-
-                instruction = "What is the next word in this text? Respond with ONLY the next word and nothing else."
-                full_prompt = f"{prompt_text}\n{instruction}"
-                true_next_word = words[wi + 1]
-                predicted_next_word, usage_info = nano_next_word(full_prompt)
-
-                print(f"\nEvaluating: [...{prompt_text[-80:]}]")
-                print(f"  True next word:      '{true_next_word}'")
-                print(f"  Predicted next word: '{predicted_next_word}'")
-
-                is_match = (predicted_next_word.lower().strip() == true_next_word.lower().strip())
-                print(f"  Match: {is_match}")
-
-                if usage_info and not usage_info.get('error'):
-                    print(f"  Usage (API call): {usage_info}")
-                    if 'total_tokens' in usage_info:
-                        total_tokens_used_api += usage_info['total_tokens']
-                elif usage_info.get('error'):
-                    print(f"  API call failed or skipped for this word: {usage_info.get('error')}")
-                else:
-                    print(f"  Usage (cached): Previous usage info might be in cache if available.")
+    # Prompts are passed lazily with their precomputed keys, so a warm cache never builds them.
+    jobs = [(partial(table.full_prompt, i), table.keys[i]) for i in order]
+    predictor = predictor or _current_predictor()
+    if predictor is not None:
+        predictions = _iter_predictions_local(table, order, predictor, deadline)
+    elif speculative_words > 1:
+        predictions = _iter_predictions_speculative(table, order, deadline, concurrency, speculative_words,
+                                                    token_budget)
+    elif concurrency > 1:
+        predictions = _iter_predictions_concurrent(jobs, deadline, concurrency)
+    else:
+        predictions = _iter_predictions_sequential(jobs, deadline)
 
+    try:
+        for i, (predicted_next_word, usage_info) in zip(order, predictions):
+            prompt_text = table.prompt_text(i) if verbose else None
+            true_next_word = table.true_words[i]
+            is_match, api_tokens = _report_prediction(prompt_text, true_next_word, predicted_next_word, usage_info,
+                                                      verbose)
+            total_tokens_used_api += api_tokens
+            if api_tokens:
+                prompt_tokens_api += usage_info.get('prompt_tokens', 0)
+            if not usage_info.get('speculated') and not usage_info.get('predictor'):
+                prediction_calls += 1
+                prompt_tokens_estimated += (table.prompt_lengths[i] + 3) // 4 + INSTRUCTION_TOKENS
+            if usage_info.get('error'):
+                failed_predictions += 1
+            else:
                 total_predictions += 1
                 if is_match:
                     correct_predictions += 1
-
-            if time_limit_reached_flag:
+            if token_budget is not None and total_tokens_used_api >= token_budget:
+                budget_exhausted = True
+                break
+            if (early_kind and total_predictions >= min_predictions
+                    and _early_stop_reached(correct_predictions, total_predictions, early_kind, early_value, alpha)):
+                stopped_early = True
                 break
-            context += sentence + " "
+
+        if (not stopped_early and not budget_exhausted and token_budget is not None
+                and total_predictions + failed_predictions < len(table) and time.time() <= deadline):
+            budget_exhausted = True  # speculative chains stop themselves once their calls use up the budget
+        if stopped_early:
+            METRICS.inc("early_stops_total", rule=early_kind)
+            if verbose:
+                print(f"\nEarly stop ({early_stop}): verdict settled after {total_predictions} of "
+                      f"{len(table)} positions.")
+        elif budget_exhausted:
+            METRICS.inc("budget_stops_total")
+            if verbose:
+                print(f"\nToken budget of {token_budget} reached after {total_tokens_used_api} API tokens. Stopping.")
+        elif total_predictions + failed_predictions < len(table):
+            if verbose:
+                print(f"\nTime limit of {time_limit} seconds reached during word processing. Stopping.")
+            time_limit_reached_flag = True
     except KeyboardInterrupt:
         print("\nProcess interrupted by user (KeyboardInterrupt). Reporting current progress.")
     finally:
+        predictions.close()
         score_percentage = 0.0
         if total_predictions > 0:
             score_percentage = (correct_predictions / total_predictions) * 100
-            print(f"\nFinal Match Rate: {correct_predictions}/{total_predictions} ({score_percentage:.2f}%)")
-        elif time_limit_reached_flag:
-            print(
-                f"\nTime limit reached. Final Match Rate: {correct_predictions}/{total_predictions} ({score_percentage:.2f}%)")
-        else:
-            print(
-                "\nNo valid predictions were made (e.g., text too short, or process interrupted before any predictions).")
-
-        print(f"Total tokens used from new API calls (non-cached): {total_tokens_used_api}")
         elapsed_time = time.time() - start_time
-        print(f"Processing duration: {elapsed_time:.2f} seconds.")
+        run_stats = {
+            'predictions': total_predictions,
+            'correct': correct_predictions,
+            'failed': failed_predictions,
+            'positions': len(table),
+            'prediction_calls': prediction_calls,
+            'api_tokens': total_tokens_used_api,
+            'prompt_tokens_api': prompt_tokens_api,
+            'prompt_tokens_estimated': prompt_tokens_estimated,
+            'context_policy': context_policy or 'full',
+            'time_limit_reached': time_limit_reached_flag,
+            'stopped_early': stopped_early,
+            'budget_exhausted': budget_exhausted,
+            # After an early stop only the confidence sequence is still a valid interval.
+            'score_interval': tuple(100 * x for x in (
+                confidence_sequence(correct_predictions, total_predictions, alpha) if early_kind
+                else wilson_interval(correct_predictions, total_predictions))),
+            'elapsed_seconds': elapsed_time,
+        }
+        METRICS.inc("scores_total")
+        METRICS.observe("score_seconds", elapsed_time)
+        METRICS.emit("score", score=score_percentage, **run_stats)
+        if stats is not None:
+            stats.update(run_stats)
+
+        if verbose:
+            if total_predictions > 0:
+                low, high = run_stats['score_interval']
+                print(f"\nFinal Match Rate: {correct_predictions}/{total_predictions} ({score_percentage:.2f}%, "
+                      f"{100 * confidence:.0f}% interval {low:.1f}-{high:.1f}%)")
+            elif time_limit_reached_flag:
+                print(
+                    f"\nTime limit reached. Final Match Rate: {correct_predictions}/{total_predictions} ({score_percentage:.2f}%)")
+            else:
+                print(
+                    "\nNo valid predictions were made (e.g., text too short, or process interrupted before any predictions).")
+
+            print(f"Total tokens used from new API calls (non-cached): {total_tokens_used_api}")
+            if failed_predictions:
+                print(f"{failed_predictions} predictions failed after retries and were left out of the score.")
+            if speculative_words > 1:
+                print(f"Speculative mode: {prediction_calls} prediction requests for {total_predictions} words.")
+            if prediction_calls:
+                print(f"Context policy '{context_policy or 'full'}': ~{prompt_tokens_estimated} prompt tokens sent "
+                      f"(~{prompt_tokens_estimated / prediction_calls:.0f} per request, {prompt_tokens_api} reported by the API).")
+            print(f"Processing duration: {elapsed_time:.2f} seconds.")
         return score_percentage, total_tokens_used_api
 
 
-# --- Plotting Function ---
-def plot_with_icons(score, author_name_on_plot):
-    # Base benchmarks and their icons
-    base_benchmarks_data = {
-        "James Joyce": {"score": 2.45, "icon": "james_joyce_icon.png"},
-        "KITT": {"score": 6.25, "icon": "kitt_icon.png"},
-        "Al Gore": {"score": 17.71, "icon": "al_gore_icon.png"},
-        "Elizabeth Holmes": {"score": 27.42, "icon": "elizabeth_holmes_icon.png"},
-    }
-
-    # Prepare lists for plotting
-    names_to_plot = list(base_benchmarks_data.keys()) + [author_name_on_plot]
-    scores_to_plot = [data["score"] for data in base_benchmarks_data.values()] + [score]
-
-    icon_file_names = [data["icon"] for data in base_benchmarks_data.values()] + ["brain.png"]  # Default icon for input
-
-    icon_paths_to_plot = [os.path.join("images", "icons", fname) for fname in icon_file_names]
-
-    # Define colors (ensure enough colors for all bars)
-    colors = ["#FF9999", "#FFE699", "#99FFCC", "#99CCFF", "#CC99FF", "#E3B7D4"]
-    if len(names_to_plot) > len(colors):  # Fallback if more bars than defined colors
-        colors.extend(["#D3D3D3"] * (len(names_to_plot) - len(colors)))
-    plot_colors = colors[:len(names_to_plot)]
-
-    fig, ax = plt.subplots(figsize=(12, 8))  # Slightly larger figure size
-    bars = ax.bar(names_to_plot, scores_to_plot, color=plot_colors)
-    ax.set_ylim(0, max(scores_to_plot) * 1.3 if scores_to_plot else 10)
-
-    # Increased font sizes
-    ax.set_ylabel("LLM Probability (%)", fontsize=14)
-    ax.set_title("KITT Scale Comparison", fontsize=18)
-    plt.xticks(rotation=20, ha="right", fontsize=12)  # Adjusted rotation and font size
-    plt.yticks(fontsize=12)
-
-    for bar, name, icon_path_str in zip(bars, names_to_plot, icon_paths_to_plot):
-        if os.path.exists(icon_path_str):
+def rank_models(input_text, models, max_sentences=4, concurrency=8, context_policy=None,
+                time_limit=MAX_EXECUTION_TIME_SECONDS, stats=None, verbose=True):
+    """Score input_text against several models in one pass and rank them by match rate.
+
+    Sentence splitting, prompt building and prompt hashing are done once;
+    every (position, model) prediction then goes to one pool of concurrency
+    threads. With N models and N times the threads of a single-model run,
+    the pass takes about as long as that run instead of N times as long.
+    Each model keeps its own namespace in the shared cache.
+
+    Returns [(model, score_percentage, api_tokens), ...], best match first:
+    the model whose next-word predictions the text follows most closely. If
+    a stats dict is passed it gets per-model predictions, correct, failed
+    and api_tokens under stats['models'].
+    """
+    start_time = time.time()
+    deadline = start_time + time_limit if time_limit is not None else float('inf')
+    models = list(dict.fromkeys(models))
+    with METRICS.phase("prompt_build"):
+        table = PromptTable(split_sentences(input_text)[:max_sentences], context_policy)
+
+    per_model = {model: {'predictions': 0, 'correct': 0, 'failed': 0, 'api_tokens': 0} for model in models}
+    # Position-major order, so every model advances through the text together
+    # and a time limit cuts all of them at about the same point.
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    jobs = [(model, i, executor.submit(_nano_complete, partial(table.full_prompt, i), 2, 1, "rank_models", model,
+                                       table.keys[i]))
+            for i in range(len(table)) for model in models]
+    time_limit_reached_flag = False
+    try:
+        for model, i, future in jobs:
+            remaining = deadline - time.time()
             try:
-                icon_img = Image.open(icon_path_str)
-                zoom_level = 0.45  # Adjusted default zoom
-                if bar.get_height() < 10:
-                    zoom_level = 0.3
-                elif bar.get_height() > 50:
-                    zoom_level = 0.55
-
-                im = OffsetImage(icon_img, zoom=zoom_level)
-                ab = AnnotationBbox(
-                    im,
-                    (bar.get_x() + bar.get_width() / 2, bar.get_height()),
-                    frameon=False,
-                    box_alignment=(0.5, -0.1),  # Fine-tuned alignment
-                    pad=0.2
-                )
-                ax.add_artist(ab)
-            except Exception as e:
-                print(f"Failed to load or place icon for {name} ({icon_path_str}): {e}")
-        else:
-            print(f"Icon path not found for {name}: {icon_path_str}")
+                if remaining <= 0:
+                    raise FuturesTimeoutError
+                predicted_next_word, usage_info = future.result(
+                    timeout=remaining if remaining != float('inf') else None)
+            except FuturesTimeoutError:
+                time_limit_reached_flag = True
+                break
+            is_match, api_tokens = _report_prediction(None, table.true_words[i], predicted_next_word, usage_info,
+                                                      verbose=False)
+            counts = per_model[model]
+            counts['api_tokens'] += api_tokens
+            if usage_info.get('error'):
+                counts['failed'] += 1
+            else:
+                counts['predictions'] += 1
+                counts['correct'] += is_match
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    ranking = sorted(
+        ((model, (c['correct'] / c['predictions']) * 100 if c['predictions'] else 0.0, c['api_tokens'])
+         for model, c in per_model.items()),
+        key=lambda item: item[1], reverse=True)
+    elapsed_time = time.time() - start_time
+    METRICS.emit("ranking", ranking=ranking, elapsed_seconds=elapsed_time)
+    if stats is not None:
+        stats.update({
+            'models': per_model,
+            'positions': len(table),
+            'time_limit_reached': time_limit_reached_flag,
+            'elapsed_seconds': elapsed_time,
+        })
+    if verbose:
+        if time_limit_reached_flag:
+            print(f"\nTime limit of {time_limit} seconds reached; ranking the predictions made so far.")
+        print(f"\nModel ranking over {len(table)} positions ({elapsed_time:.2f} seconds):")
+        for rank, (model, score_percentage, api_tokens) in enumerate(ranking, 1):
+            counts = per_model[model]
+            print(f"  {rank}. {model:<24} {score_percentage:6.2f}% ({counts['correct']}/{counts['predictions']}, "
+                  f"{api_tokens} API tokens)")
+    return ranking
+
+
+class StreamingScorer:
+    """Score a live transcript incrementally, one new word position at a time.
+
+    Words arrive through feed_text() or, for realtime transcription events,
+    feed_delta() / feed_completed(). Deltas are only held per item until that
+    item's completed transcript replaces them, so every spoken word is scored
+    once. score_pending() predicts just the positions added since the last
+    call, against a rolling context bounded by context_policy, and keeps a
+    running match count across calls.
+
+    If scoring falls behind, max_pending_words caps the backlog predicted in
+    one call: older queued words beyond the cap only extend the context and
+    are counted in skipped_words instead of costing an API call each.
+    """
+
+    def __init__(self, context_policy="words:200", concurrency=1, verbose=False, max_pending_words=None):
+        self.context_policy = context_policy
+        self.concurrency = concurrency
+        self.verbose = verbose
+        self.max_pending_words = max_pending_words
+        self._kind, limit = parse_context_policy(context_policy)
+        # Only as much history as the policy can use is kept, so memory stays flat.
+        self._previous_sentences = deque(maxlen={"full": None, "sentences": limit}.get(self._kind, 0))
+        # Every word costs at least one token, so limit words always cover a "tokens" window too.
+        self._recent_words = deque(maxlen=max(limit, 1) if self._kind in ("words", "tokens") else 0)
+        self._limit = limit
+        self._context = ""
+        self._sentence_words = []
+        self._ready_words = []
+        self._pending_deltas = OrderedDict()  # item_id -> delta text not yet confirmed by a completed event
+        self._lock = threading.Lock()
+        self._score_lock = threading.Lock()
+        self.predictions = 0
+        self.correct = 0
+        self.api_tokens = 0
+        self.skipped_words = 0
+        self.failed = 0
+
+    def feed_text(self, text):
+        """Queue finished text (words already final) for scoring."""
+        words = split_words(text)
+        if words:
+            with self._lock:
+                self._ready_words.extend(words)
+
+    def feed_delta(self, item_id, delta):
+        """Hold a partial transcription for item_id until its completed transcript arrives."""
+        with self._lock:
+            self._pending_deltas[item_id] = self._pending_deltas.get(item_id, "") + delta
+
+    def feed_completed(self, item_id, transcript):
+        """Replace item_id's deltas with its final transcript and queue that for scoring."""
+        with self._lock:
+            self._pending_deltas.pop(item_id, None)
+            self._ready_words.extend(split_words(transcript))
+
+    def flush_deltas(self):
+        """Queue the text of items that never got a completed event (e.g. at shutdown)."""
+        with self._lock:
+            for delta in self._pending_deltas.values():
+                self._ready_words.extend(split_words(delta))
+            self._pending_deltas.clear()
+
+    @property
+    def pending_words(self):
+        return len(self._ready_words)
+
+    @property
+    def score(self):
+        return (self.correct / self.predictions) * 100 if self.predictions else 0.0
+
+    def _take_positions(self):
+        # Turn queued words into prediction positions, advancing the sentence
+        # and context state; mirrors PromptTable for one stream.
+        with self._lock:
+            words, self._ready_words = self._ready_words, []
+        skip = 0
+        if self.max_pending_words is not None and len(words) > self.max_pending_words:
+            skip = len(words) - self.max_pending_words
+            self.skipped_words += skip
+            METRICS.inc("stream_words_skipped_total", skip)
+        positions = []
+        for i, word in enumerate(words):
+            if self._sentence_words and i >= skip:
+                if self._recent_words.maxlen:
+                    recent = list(self._recent_words)
+                    prompt_text = " ".join(recent[_window_start(recent, len(recent), self._kind, self._limit):])
+                else:
+                    prompt_text = (self._context + " ".join(self._sentence_words)).strip()
+                positions.append((prompt_text, f"{prompt_text}\n{INSTRUCTION}", word))
+            self._sentence_words.append(word)
+            self._recent_words.append(word)
+            if word[-1] in ".!?":
+                self._end_sentence()
+        return positions
+
+    def _end_sentence(self):
+        sentence = " ".join(self._sentence_words)
+        self._previous_sentences.append(sentence)
+        self._sentence_words = []
+        if not self._recent_words.maxlen:
+            self._context = _context_for(list(self._previous_sentences), self._kind, self._limit)
+
+    def score_pending(self):
+        """Score every queued word position; returns (segment_score, segment_predictions, api_tokens)."""
+        with self._score_lock:
+            positions = self._take_positions()
+            if not positions:
+                return 0.0, 0, 0
+            jobs = [(full_prompt, None) for _, full_prompt, _ in positions]
+            if self.concurrency > 1:
+                predictions = _iter_predictions_concurrent(jobs, float('inf'), self.concurrency)
+            else:
+                predictions = _iter_predictions_sequential(jobs, float('inf'))
+            correct = api_tokens = failed = 0
+            for (prompt_text, _, true_next_word), (predicted_next_word, usage_info) in zip(positions, predictions):
+                is_match, tokens = _report_prediction(prompt_text, true_next_word, predicted_next_word, usage_info,
+                                                      self.verbose)
+                failed += bool(usage_info.get('error'))
+                correct += is_match
+                api_tokens += tokens
+            scored = len(positions) - failed
+            with self._lock:
+                self.predictions += scored
+                self.correct += correct
+                self.api_tokens += api_tokens
+                self.failed += failed
+            return ((correct / scored) * 100 if scored else 0.0), scored, api_tokens
+
+
+# --- Plotting Function ---
+def plot_with_icons(score, author_name_on_plot, output_path="kitt_scale_plot.png", show=None):
+    """Save the KITT Scale chart for score to output_path and return its PNG bytes.
+
+    Rendering is headless (see kitt_plot). show=None opens the chart in a
+    window only when a display is available; servers should pass False or
+    use kitt_plot.render_png() directly.
+    """
+    from kitt_plot import render_png
+
+    png = render_png(score, author_name_on_plot, dpi=300)  # Increased resolution
+    if output_path:
+        with open(output_path, "wb") as f:
+            f.write(png)
+        print(f"Plot saved to {output_path}")
+    if show is None:
+        show = sys.platform in ("darwin", "win32") or bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+    if show:
+        import io
+        import matplotlib.pyplot as plt
+        from PIL import Image
 
-    plt.tight_layout(pad=3.0)  # Increased padding
-    plt.savefig("kitt_scale_plot.png", dpi=300)  # Increased resolution
-    print("Plot saved to kitt_scale_plot.png")
-    plt.show()
-    plt.close()
+        fig, ax = plt.subplots(figsize=(12, 8))
+        ax.imshow(Image.open(io.BytesIO(png)))
+        ax.axis("off")
+        plt.tight_layout(pad=0)
+        plt.show()
+        plt.close(fig)
+    return png
 
 
 # --- Main Execution Block ---
 if __name__ == "__main__":
-    default_author_name = "Stephen Hawking"
-    default_hawking_quote = (
-        "IF you remember every word in this book, your memory will have "
-        "recorded about two million pieces of information: the order in your "
-        "brain will have increased by about two million units. However, while "
-        "you have been reading the book, you will have converted at least a "
-        "thousand calories of ordered energy, in the form of food, into "
-        "disordered energy, in the form of heat that you lose to the air around "
-        "you by convection and sweat. This will increase the disorder of the "
-        "universe by about twenty million million million million units - or "
-        "about ten million million million times the increase in order in your "
-        "brain - and that's if you remember everything in this book."
-    )
+    from benchmark_texts import DEFAULT_AUTHOR_NAME as default_author_name
+    from benchmark_texts import DEFAULT_HAWKING_QUOTE as default_hawking_quote
 
     user_name_input = input(f"Enter author's name (or press Enter for '{default_author_name}'): ").strip()
     author_name_to_use = user_name_input or default_author_name
@@ -264,6 +1168,7 @@ if __name__ == "__main__":
         sample_text_to_analyze = user_text_input
 
     try:
+        init()
         if not openai.api_key:
             print("OPENAI_API_KEY is not set in the environment. Please set it to run the example.")
         else:
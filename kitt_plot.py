@@ -0,0 +1,235 @@
+import argparse
+import io
+import json
+import os
+import threading
+from functools import lru_cache
+
+# Headless KITT Scale rendering. Uses matplotlib's Agg canvas directly (no
+# pyplot, no display, no shared global figure), draws the benchmark bars and
+# their icons once per renderer and, for each result, only restores that
+# cached background and draws the candidate bar, icon and label on top.
+# Results come back as PNG bytes, so nothing is written to a shared file.
+
+ICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images", "icons")
+
+# Base benchmarks and their icons
+BASE_BENCHMARKS = {
+    "James Joyce": {"score": 2.45, "icon": "james_joyce_icon.png"},
+    "KITT": {"score": 6.25, "icon": "kitt_icon.png"},
+    "Al Gore": {"score": 17.71, "icon": "al_gore_icon.png"},
+    "Elizabeth Holmes": {"score": 27.42, "icon": "elizabeth_holmes_icon.png"},
+}
+CANDIDATE_ICON = "brain.png"  # Default icon for input
+COLORS = ["#FF9999", "#FFE699", "#99FFCC", "#99CCFF", "#CC99FF", "#E3B7D4"]
+
+
+@lru_cache(maxsize=None)
+def load_icon(path):
+    """Decode an icon once per process; returns an RGBA array, or None if it can't be read."""
+    import numpy as np
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            return np.asarray(img.convert("RGBA"))
+    except (OSError, ValueError) as e:
+        print(f"Failed to load icon {path}: {e}")
+        return None
+
+
+def _icon_zoom(height):
+    if height < 10:
+        return 0.3
+    if height > 50:
+        return 0.55
+    return 0.45
+
+
+class KittPlotRenderer:
+    """Render KITT Scale comparison charts to PNG bytes, reusing everything but the candidate bar.
+
+    The y axis runs to 1.3x the highest score, as before. As long as the
+    candidate stays below the top benchmark that limit is fixed, so the
+    cached background (benchmark bars, icons, axes) is blitted and only the
+    candidate is drawn; a higher candidate rescales the axis and gets a full
+    redraw. A renderer is not shared between threads without its lock, which
+    render() takes.
+    """
+
+    def __init__(self, dpi=100, figsize=(12, 8), benchmarks=None, icon_dir=ICON_DIR, png_compress_level=6):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.offsetbox import AnnotationBbox, OffsetImage
+        from matplotlib.ticker import FixedFormatter
+
+        self._AnnotationBbox = AnnotationBbox
+        self._OffsetImage = OffsetImage
+        self.png_compress_level = png_compress_level
+        self.benchmarks = benchmarks or BASE_BENCHMARKS
+        self.icon_dir = icon_dir
+        self._lock = threading.Lock()
+        self.full_redraws = 0
+        self.blits = 0
+
+        names = list(self.benchmarks)
+        scores = [data["score"] for data in self.benchmarks.values()]
+        self._base_limit = max(scores) * 1.3 if scores else 10
+        self._x = len(names)  # candidate slot
+
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        colors = COLORS + ["#D3D3D3"] * max(0, len(names) + 1 - len(COLORS))
+        bars = self.ax.bar(range(len(names) + 1), scores + [0.0], color=colors[:len(names) + 1])
+        self._bar = bars[-1]
+        self.ax.set_ylim(0, self._base_limit)
+
+        # Increased font sizes
+        self.ax.set_ylabel("LLM Probability (%)", fontsize=14)
+        self.ax.set_title("KITT Scale Comparison", fontsize=18)
+        self.ax.set_xticks(range(len(names) + 1))
+        # The candidate's tick label is drawn with the candidate, so it starts out empty.
+        self.ax.set_xticklabels(names + [""], rotation=20, ha="right", fontsize=12)
+        self.ax.tick_params(axis="y", labelsize=12)
+        self._tick_labels = names + [""]
+        self.ax.xaxis.set_major_formatter(FixedFormatter(self._tick_labels))
+        self._label = self.ax.get_xticklabels()[-1]
+
+        self._base_icons = []
+        for bar, data in zip(bars, self.benchmarks.values()):
+            artist = self._icon_artist(os.path.join(icon_dir, data["icon"]), bar)
+            if artist is not None:
+                self._base_icons.append((artist, bar))
+        self._candidate_icon = self._icon_artist(os.path.join(icon_dir, CANDIDATE_ICON), self._bar)
+
+        # Room for long candidate names, fixed so the layout never shifts between renders.
+        self.figure.subplots_adjust(left=0.08, right=0.97, top=0.92, bottom=0.2)
+        self._background = None
+
+    def _icon_artist(self, path, bar):
+        icon = load_icon(path) if os.path.exists(path) else None
+        if icon is None:
+            print(f"Icon path not found or unreadable: {path}")
+            return None
+        image = self._OffsetImage(icon, zoom=_icon_zoom(bar.get_height()))
+        artist = self._AnnotationBbox(image, (bar.get_x() + bar.get_width() / 2, bar.get_height()),
+                                      frameon=False, box_alignment=(0.5, -0.1), pad=0.2)
+        self.ax.add_artist(artist)
+        return artist
+
+    def _set_candidate(self, score, name):
+        self._bar.set_height(score)
+        # A full draw re-labels the ticks from the axis formatter, a blit draws the Text as it is.
+        self._tick_labels[-1] = name
+        self._label.set_text(name)
+        if self._candidate_icon is not None:
+            # xybox is where the icon is drawn; it defaults to a copy of xy, so both move.
+            self._candidate_icon.xy = self._candidate_icon.xybox = (
+                self._bar.get_x() + self._bar.get_width() / 2, score)
+            self._candidate_icon.offsetbox.set_zoom(_icon_zoom(score))
+
+    def _candidate_artists(self):
+        artists = [self._bar, self._label]
+        if self._candidate_icon is not None:
+            artists.append(self._candidate_icon)
+        return artists
+
+    def _full_draw(self, limit):
+        self.ax.set_ylim(0, limit)
+        self.canvas.draw()
+        self.full_redraws += 1
+
+    def render(self, score, name):
+        """Draw one result and return the chart as PNG bytes."""
+        with self._lock:
+            score = max(0.0, float(score))
+            limit = max(self._base_limit, score * 1.3)
+            if limit != self._base_limit:
+                self._set_candidate(score, name)
+                self._full_draw(limit)
+                # The cached background was drawn at the base limit; put the axis back for the next render.
+                self.ax.set_ylim(0, self._base_limit)
+            else:
+                if self._background is None:
+                    for artist in self._candidate_artists():
+                        artist.set_visible(False)
+                    self._full_draw(self._base_limit)
+                    self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+                    for artist in self._candidate_artists():
+                        artist.set_visible(True)
+                self._set_candidate(score, name)
+                self.canvas.restore_region(self._background)
+                renderer = self.canvas.get_renderer()
+                for artist in self._candidate_artists():
+                    artist.draw(renderer)
+                # The bar covers the bottom spine, which a full draw paints on top of it.
+                spine = self.ax.spines["bottom"]
+                clip = spine.get_clip_box()
+                spine.set_clip_box(self._bar.get_window_extent(renderer))
+                spine.draw(renderer)
+                spine.set_clip_box(clip)
+                self.blits += 1
+            return self._encode_png()
+
+    def _encode_png(self):
+        from PIL import Image
+
+        width, height = self.canvas.get_width_height()
+        image = Image.frombuffer("RGBA", (width, height), self.canvas.buffer_rgba(), "raw", "RGBA", 0, 1)
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", compress_level=self.png_compress_level,
+                   dpi=(self.figure.dpi, self.figure.dpi))
+        return buffer.getvalue()
+
+    def render_batch(self, results):
+        """Render (score, name) pairs in order; yields PNG bytes for each."""
+        for score, name in results:
+            yield self.render(score, name)
+
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+
+
+def get_renderer(dpi=100):
+    """Shared renderer per dpi, so the icons and background are set up once per process."""
+    with _renderers_lock:
+        renderer = _renderers.get(dpi)
+        if renderer is None:
+            renderer = _renderers[dpi] = KittPlotRenderer(dpi=dpi)
+        return renderer
+
+
+def render_png(score, name, dpi=100):
+    return get_renderer(dpi).render(score, name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render KITT Scale charts for scored documents.")
+    parser.add_argument("results", help="JSONL of {'id', 'score'} records, e.g. the output of batch_score.py")
+    parser.add_argument("-o", "--output-dir", default="kitt_plots")
+    parser.add_argument("--dpi", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    records = []
+    with open(args.results, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "score" in record:
+                records.append(record)
+    os.makedirs(args.output_dir, exist_ok=True)
+    renderer = KittPlotRenderer(dpi=args.dpi)
+    for record, png in zip(records, renderer.render_batch((r["score"], str(r["id"])) for r in records)):
+        safe_id = "".join(c if c.isalnum() or c in "-_." else "_" for c in str(record["id"]))
+        with open(os.path.join(args.output_dir, f"{safe_id}.png"), "wb") as out:
+            out.write(png)
+    print(f"Rendered {len(records)} charts to {args.output_dir} "
+          f"({renderer.blits} incremental, {renderer.full_redraws} full redraws).")
+
+
+if __name__ == "__main__":
+    main()
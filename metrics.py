@@ -0,0 +1,209 @@
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, shared by every histogram.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bucket bound holding the q-th quantile (an estimate, as in Prometheus)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Thread-safe counters, gauges and latency histograms, plus event sinks.
+
+    Sinks are callables that receive event dicts (one per scored prediction,
+    API error, finished score, ...). JsonLinesSink and PrometheusExporter are
+    ready-made ones; any function works too.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.sinks = []
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def phase(self, phase):
+        """Time a block as one of the scoring phases (prompt_build, hash, network, compare, ...)."""
+        return self.timer("phase_seconds", phase=phase)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink):
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+
+    def emit(self, event_type, **fields):
+        if not self.sinks:
+            return
+        event = {"type": event_type, "ts": time.time(), **fields}
+        for sink in list(self.sinks):
+            try:
+                sink(event)
+            except Exception as e:
+                print(f"Metrics sink {sink!r} failed: {e}")
+
+    def counter(self, name, **labels):
+        return self.counters.get((name, _label_key(labels)), 0)
+
+    def snapshot(self):
+        """Plain-dict view of every metric, for logging or JSON."""
+        with self._lock:
+            def flat(name, key):
+                return name + _format_labels(key)
+            return {
+                "counters": {flat(n, k): v for (n, k), v in self.counters.items()},
+                "gauges": {flat(n, k): v for (n, k), v in self.gauges.items()},
+                "histograms": {
+                    flat(n, k): {"count": h.count, "sum": h.sum, "p50": h.quantile(0.5),
+                                 "p95": h.quantile(0.95), "p99": h.quantile(0.99)}
+                    for (n, k), h in self.histograms.items()
+                },
+            }
+
+    def render_prometheus(self, prefix="isitllm_"):
+        lines = []
+        with self._lock:
+            for (name, key), value in sorted(self.counters.items()):
+                lines.append(f"{prefix}{name}{_format_labels(key)} {value}")
+            for (name, key), value in sorted(self.gauges.items()):
+                lines.append(f"{prefix}{name}{_format_labels(key)} {value}")
+            for (name, key), h in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, n in zip(h.buckets + (float('inf'),), h.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float('inf') else repr(bound)
+                    lines.append(f"{prefix}{name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+                lines.append(f"{prefix}{name}_sum{_format_labels(key)} {h.sum}")
+                lines.append(f"{prefix}{name}_count{_format_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+
+class JsonLinesSink:
+    """Append events to a JSON-lines file, flushing every flush_every events."""
+
+    def __init__(self, path, flush_every=100):
+        self.path = path
+        self.flush_every = flush_every
+        self._fh = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def __call__(self, event):
+        with self._lock:
+            self._fh.write(json.dumps(event) + "\n")
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._fh.flush()
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            if not self._fh.closed:
+                self._fh.flush()
+                self._fh.close()
+
+
+class PrometheusExporter:
+    """Serve metrics.render_prometheus() at http://host:port/metrics from a daemon thread."""
+
+    def __init__(self, metrics, port=9464, host="127.0.0.1"):
+        # Imported here: http.server is slow to import and only the exporter needs it.
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        exporter_metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter_metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+METRICS = Metrics()
@@ -0,0 +1,331 @@
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    model TEXT NOT NULL,
+    key BLOB NOT NULL,
+    word TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (model, key)
+) WITHOUT ROWID
+"""
+
+
+def usage_counts(usage):
+    """Reduce an API usage dict to the (prompt, completion, total) token counts we keep."""
+    usage = usage or {}
+    return (
+        int(usage.get('prompt_tokens') or 0),
+        int(usage.get('completion_tokens') or 0),
+        int(usage.get('total_tokens') or 0),
+    )
+
+
+def usage_dict(prompt_tokens, completion_tokens, total_tokens):
+    return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': total_tokens}
+
+
+class PredictionCache:
+    """Next-word predictions stored one row per prompt in SQLite.
+
+    Lookups and inserts touch a single row, so nothing is loaded up front and a
+    new entry costs one small write instead of re-serialising the whole cache.
+    WAL mode plus a busy timeout lets several threads and processes share the
+    same file; each thread gets its own connection.
+    """
+
+    def __init__(self, path, legacy_pickle=None, legacy_model=None, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(SCHEMA)
+        if legacy_pickle:
+            self.migrate_pickle(legacy_pickle, legacy_model)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: autocommit, so every put is its own short transaction.
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, model):
+        """Return (word, usage) for key, or None on a miss."""
+        row = self._conn().execute(
+            "SELECT word, prompt_tokens, completion_tokens, total_tokens FROM predictions WHERE model = ? AND key = ?",
+            (model, key),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], usage_dict(*row[1:])
+
+    def put(self, key, model, word, usage):
+        # Greedy decoding gives the same answer for the same prompt, so the first writer wins.
+        self._conn().execute(
+            "INSERT OR IGNORE INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (model, key, word, *usage_counts(usage), time.time()),
+        )
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    @staticmethod
+    def _where(models=None, since=None):
+        clauses, params = [], []
+        if models:
+            clauses.append(f"model IN ({', '.join('?' * len(models))})")
+            params.extend(models)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def iter_rows(self, models=None, since=None):
+        """Yield (model, key, word, prompt_tokens, completion_tokens, total_tokens, created_at) rows.
+
+        Only rows of the given models and created at or after since (a Unix
+        time) are returned, ordered by model and key.
+        """
+        where, params = self._where(models, since)
+        yield from self._conn().execute(
+            "SELECT model, key, word, prompt_tokens, completion_tokens, total_tokens, created_at "
+            f"FROM predictions{where} ORDER BY model, key", params)
+
+    def merge_rows(self, rows, batch_size=10_000):
+        """Insert rows shaped like iter_rows(), in batched transactions; returns how many rows changed.
+
+        When (model, key) is already present the older entry is kept, so
+        merging the same caches in any order gives the same result.
+        """
+        conn = self._conn()
+        before = conn.total_changes
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                self._merge_batch(conn, batch)
+                batch = []
+        if batch:
+            self._merge_batch(conn, batch)
+        return conn.total_changes - before
+
+    @staticmethod
+    def _merge_batch(conn, batch):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (model, key) DO UPDATE SET "
+                "word = excluded.word, prompt_tokens = excluded.prompt_tokens, "
+                "completion_tokens = excluded.completion_tokens, total_tokens = excluded.total_tokens, "
+                "created_at = excluded.created_at WHERE excluded.created_at < predictions.created_at",
+                batch)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, models=None, before=None, keep_models=None):
+        """Delete the rows of models, rows created before a Unix time, and rows of models not in keep_models.
+
+        Returns the number of rows deleted. Run vacuum() afterwards to give the space back.
+        """
+        conn = self._conn()
+        deleted = 0
+        if models:
+            deleted += conn.execute(
+                f"DELETE FROM predictions WHERE model IN ({', '.join('?' * len(models))})", list(models)).rowcount
+        if keep_models:
+            deleted += conn.execute(
+                f"DELETE FROM predictions WHERE model NOT IN ({', '.join('?' * len(keep_models))})",
+                list(keep_models)).rowcount
+        if before is not None:
+            deleted += conn.execute("DELETE FROM predictions WHERE created_at < ?", (before,)).rowcount
+        return deleted
+
+    def vacuum(self):
+        """Fold the WAL back into the database and rebuild it without free pages."""
+        conn = self._conn()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+
+    def model_summary(self):
+        """{model: (entries, oldest created_at, newest created_at)}."""
+        rows = self._conn().execute(
+            "SELECT model, COUNT(*), MIN(created_at), MAX(created_at) FROM predictions GROUP BY model ORDER BY model")
+        return {model: (count, oldest, newest) for model, count, oldest, newest in rows}
+
+    def migrate_pickle(self, pickle_path, model):
+        """One-time import of the old {sha256 hex: {'word', 'usage'}} pickle cache.
+
+        The pickle only ever held one model's answers, stored here under model.
+        It is renamed to <name>.migrated afterwards so it is not read again.
+        """
+        if not os.path.exists(pickle_path):
+            return 0
+        try:
+            with open(pickle_path, "rb") as f:
+                legacy = pickle.load(f)
+        except Exception as e:
+            print(f"Error loading legacy cache file {pickle_path}: {e}. Skipping migration.")
+            return 0
+
+        now = time.time()
+        rows = [
+            (model, bytes.fromhex(h), entry.get('word', ''), *usage_counts(entry.get('usage')), now)
+            for h, entry in legacy.items()
+        ]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        try:
+            os.replace(pickle_path, pickle_path + ".migrated")
+        except OSError as e:
+            # Another process may have migrated and renamed it first; the inserts above are idempotent.
+            print(f"Could not rename {pickle_path} after migration: {e}")
+        print(f"Migrated {len(rows)} cached predictions from {pickle_path} to {self.path}.")
+        return len(rows)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class MemoryCacheTier:
+    """Bounded LRU of predictions kept in process memory.
+
+    Entries are (word, prompt_tokens, completion_tokens, total_tokens) tuples
+    keyed by the raw digest, and are evicted oldest-first once either
+    max_entries or max_bytes (an estimate of the Python object sizes) is
+    exceeded. A limit of 0 disables that bound.
+    """
+
+    # Rough per-entry cost of the OrderedDict slot and linked-list node.
+    _ENTRY_OVERHEAD = 100
+
+    def __init__(self, max_entries=100_000, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def _entry_size(cls, key, value):
+        return (cls._ENTRY_OVERHEAD + sys.getsizeof(key) + sys.getsizeof(value)
+                + sum(sys.getsizeof(v) for v in value))
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self._entry_size(key, value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= self._entry_size(key, old)
+            self._entries[key] = value
+            self.bytes += size
+            while self._entries and (
+                    (self.max_entries and len(self._entries) > self.max_entries)
+                    or (self.max_bytes and self.bytes > self.max_bytes)):
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self.bytes -= self._entry_size(evicted_key, evicted)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class TieredCache:
+    """A MemoryCacheTier in front of a PredictionCache, with the same get/put interface."""
+
+    def __init__(self, store, memory):
+        self.store = store
+        self.memory = memory
+        # Model names are interned to a two-byte prefix so memory keys stay
+        # compact; each model gets its own namespace, so several models can
+        # share one cache.
+        self._model_ids = {}
+        self._model_lock = threading.Lock()
+        self.store_hits = 0
+
+    def _memory_key(self, key, model):
+        prefix = self._model_ids.get(model)
+        if prefix is None:
+            with self._model_lock:
+                prefix = self._model_ids.get(model)
+                if prefix is None:
+                    prefix = self._model_ids[model] = len(self._model_ids).to_bytes(2, "big")
+        return prefix + key
+
+    def get(self, key, model):
+        memory_key = self._memory_key(key, model)
+        value = self.memory.get(memory_key)
+        if value is not None:
+            return value[0], usage_dict(*value[1:])
+        cached = self.store.get(key, model)
+        if cached is not None:
+            self.store_hits += 1
+            word, usage = cached
+            self.memory.put(memory_key, (word, *usage_counts(usage)))
+        return cached
+
+    def put(self, key, model, word, usage):
+        self.store.put(key, model, word, usage)
+        self.memory.put(self._memory_key(key, model), (word, *usage_counts(usage)))
+
+    def __len__(self):
+        return len(self.store)
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats['store_hits'] = self.store_hits
+        stats['store_misses'] = stats['misses'] - self.store_hits
+        return stats
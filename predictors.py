@@ -0,0 +1,192 @@
+import argparse
+import os
+
+import numpy as np
+
+# Local next-word predictors that can stand in for the API behind
+# isitllm.nano_next_word: offline, deterministic and cheap enough to
+# pre-screen a large corpus before spending API calls on it.
+#
+# A predictor has a name, the number of preceding words it looks at
+# (context_words) and two methods:
+#
+#   next_word(prompt_text)  -> predicted next word ('' if it has no guess)
+#   predict_batch(contexts) -> one prediction per list of preceding words
+#
+# Predictor is a base class with next_word written in terms of
+# predict_batch; any object with the same attributes works.
+
+_FNV_OFFSET = np.uint64(1469598103934665603)
+_FNV_PRIME = np.uint64(1099511628211)
+FORMAT_VERSION = 1
+
+
+class Predictor:
+    name = "predictor"
+    context_words = 1
+
+    def next_word(self, prompt_text):
+        return self.predict_batch([prompt_text.split()[-self.context_words:]])[0]
+
+    def predict_batch(self, contexts):
+        raise NotImplementedError
+
+
+def _hash_windows(ids):
+    """FNV-1a style hash of each row of an (n, k) int64 id matrix, as uint64."""
+    h = np.full(len(ids), _FNV_OFFSET, dtype=np.uint64)
+    for column in ids.T:
+        h ^= column.astype(np.uint64)
+        h *= _FNV_PRIME
+    return h
+
+
+class NgramPredictor(Predictor):
+    """Most-frequent-continuation n-gram model with backoff, stored as flat NumPy arrays.
+
+    For every context length k from order - 1 down to 1 it keeps the sorted
+    hashes of the k-word contexts seen in training and the id of their most
+    frequent next word. A prediction looks up the longest context first and
+    backs off to shorter ones, then to the most frequent word overall.
+    Lookups for a whole batch of positions are one searchsorted per context
+    length. Words are compared lowercased, like isitllm's match check.
+    """
+
+    def __init__(self, vocab, tables, unigram, order, name="ngram"):
+        self.vocab = vocab
+        self.tables = tables  # k -> (sorted context hashes, next word ids)
+        self.unigram = unigram
+        self.order = order
+        self.context_words = order - 1
+        self.name = name
+        self._ids = {word: i for i, word in enumerate(vocab)}
+
+    @classmethod
+    def train(cls, texts, order=3, name="ngram"):
+        """Build a model from an iterable of training texts."""
+        if order < 2:
+            raise ValueError(f"order must be at least 2, not {order}")
+        tokens = [word.lower() for text in texts for word in text.split()]
+        if not tokens:
+            raise ValueError("No training text")
+        vocab, ids = np.unique(np.array(tokens), return_inverse=True)
+        ids = ids.astype(np.int64)
+        tables = {}
+        for k in range(1, order):
+            if len(ids) <= k:
+                continue
+            windows = np.lib.stride_tricks.sliding_window_view(ids[:-1], k)
+            hashes = _hash_windows(windows)
+            following = ids[k:]
+            # Count (context, next word) pairs, then keep the most frequent next word per context.
+            pairs, counts = np.unique(np.stack([hashes, following.astype(np.uint64)], axis=1), axis=0,
+                                      return_counts=True)
+            best = np.lexsort((-counts, pairs[:, 0]))
+            pairs = pairs[best]
+            first = np.ones(len(pairs), dtype=bool)
+            first[1:] = pairs[1:, 0] != pairs[:-1, 0]
+            tables[k] = (pairs[first, 0], pairs[first, 1].astype(np.int32))
+        unigram = int(np.bincount(ids).argmax())
+        return cls([str(word) for word in vocab], tables, unigram, order, name)
+
+    def predict_batch(self, contexts):
+        n = len(contexts)
+        width = self.context_words
+        # Right-aligned context ids; -1 pads short contexts and marks unknown words.
+        ids = np.full((n, width), -1, dtype=np.int64)
+        for row, context in enumerate(contexts):
+            tail = context[-width:] if width else []
+            offset = width - len(tail)
+            for j, word in enumerate(tail):
+                ids[row, offset + j] = self._ids.get(word.lower(), -1)
+        predicted = np.full(n, -1, dtype=np.int64)
+        for k in range(width, 0, -1):
+            if k not in self.tables:
+                continue
+            hashes, following = self.tables[k]
+            window = ids[:, width - k:]
+            todo = (predicted < 0) & (window >= 0).all(axis=1)
+            if not todo.any():
+                continue
+            h = _hash_windows(window[todo])
+            at = np.searchsorted(hashes, h)
+            at_clipped = np.minimum(at, len(hashes) - 1)
+            found = (at < len(hashes)) & (hashes[at_clipped] == h)
+            rows = np.flatnonzero(todo)
+            predicted[rows[found]] = following[at_clipped[found]]
+        predicted[predicted < 0] = self.unigram
+        return [self.vocab[i] for i in predicted]
+
+    def save(self, path):
+        """Write the model as a compressed .npz of plain arrays (no pickles)."""
+        blob = "\n".join(self.vocab).encode("utf-8")
+        arrays = {
+            "format_version": np.array(FORMAT_VERSION),
+            "order": np.array(self.order),
+            "unigram": np.array(self.unigram),
+            "vocab": np.frombuffer(blob, dtype=np.uint8),
+        }
+        for k, (hashes, following) in self.tables.items():
+            arrays[f"hashes_{k}"] = hashes
+            arrays[f"next_{k}"] = following
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format_version"]) != FORMAT_VERSION:
+                raise ValueError(f"{path}: unsupported n-gram model format {int(data['format_version'])}")
+            order = int(data["order"])
+            vocab = data["vocab"].tobytes().decode("utf-8").split("\n")
+            tables = {k: (data[f"hashes_{k}"], data[f"next_{k}"]) for k in range(1, order)
+                      if f"hashes_{k}" in data}
+            return cls(vocab, tables, int(data["unigram"]), order,
+                       name=os.path.splitext(os.path.basename(path))[0])
+
+
+def load_predictor(path):
+    """Load a saved predictor; currently every saved predictor is an NgramPredictor."""
+    return NgramPredictor.load(path)
+
+
+def _training_texts(sources):
+    from batch_score import iter_documents
+
+    for source in sources:
+        for _, text in iter_documents(source):
+            yield text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train or use a local n-gram next-word predictor.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train = commands.add_parser("train", help="train a model from text files, JSONL corpora or directories")
+    train.add_argument("sources", nargs="+")
+    train.add_argument("-o", "--output", default="ngram_model.npz")
+    train.add_argument("--order", type=int, default=3, help="n in n-gram: the longest context is n - 1 words")
+    score = commands.add_parser("score", help="score text files with a trained model, without any API calls")
+    score.add_argument("model")
+    score.add_argument("files", nargs="+")
+    score.add_argument("--max-sentences", type=int, default=0, help="sentences to score per file; 0 for all")
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        model = NgramPredictor.train(_training_texts(args.sources), order=args.order)
+        model.save(args.output)
+        contexts = sum(len(hashes) for hashes, _ in model.tables.values())
+        print(f"Trained order-{model.order} model: {len(model.vocab)} words, {contexts} contexts "
+              f"-> {args.output} ({os.path.getsize(args.output)} bytes)")
+        return
+
+    import isitllm
+
+    model = load_predictor(args.model)
+    for path in args.files:
+        with open(path, encoding="utf-8") as f:
+            score, _ = isitllm.llm_or_human(f.read(), max_sentences=args.max_sentences or None, time_limit=None,
+                                            verbose=False, predictor=model)
+        print(f"{path}: {score:.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import random
+import threading
+import time
+
+# Client-side pacing for the completions API: token buckets for requests and
+# tokens per minute, shared by every thread in the process, and a retry
+# policy with jittered exponential backoff that honours Retry-After.
+
+
+class TokenBucket:
+    """Refills at per_minute / 60 units a second, up to capacity (one minute's worth by default).
+
+    reserve() takes the units straight away, letting the bucket go into debt,
+    and returns how long the caller has to wait before using them. Callers
+    are therefore served in arrival order and no lock is held while sleeping.
+    per_minute=0 disables the limit.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount):
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            # A single request bigger than the whole bucket would otherwise never fit.
+            self._level -= min(amount, self.capacity)
+            return -self._level / self.rate if self._level < 0 else 0.0
+
+    def adjust(self, amount):
+        """Give back (positive) or take (negative) units once the real cost of a request is known."""
+        if not self.rate:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self.capacity, self._level + amount)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits, plus a shared pause after a 429."""
+
+    def __init__(self, rpm=0, tpm=0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens):
+        """Block until a request of about estimated_tokens may be sent; returns the seconds waited."""
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        with self._lock:
+            wait = max(wait, self._paused_until - time.monotonic())
+        if wait > 0:
+            time.sleep(wait)
+        return max(0.0, wait)
+
+    def record(self, estimated_tokens, actual_tokens):
+        """Correct the token bucket by the difference between the estimate and the reported usage."""
+        self.tokens.adjust(estimated_tokens - actual_tokens)
+
+    def pause(self, seconds):
+        """Hold back every thread for seconds, so a burst of 429s slows the whole process down."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RetryPolicy:
+    def __init__(self, max_retries=5, base_delay=0.5, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt + 1.
+
+        The server's Retry-After wins when present (plus up to 20% so waiting
+        threads don't retry in lockstep); otherwise full-jitter exponential
+        backoff.
+        """
+        if retry_after is not None:
+            return min(self.max_delay, retry_after * random.uniform(1.0, 1.2))
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def retry_after_seconds(headers):
+    """Parse retry-after-ms / retry-after (seconds) response headers; None if absent or unparseable."""
+    if not headers:
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except ValueError:
+            continue  # an HTTP date; fall back to backoff
+    return None
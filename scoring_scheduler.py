@@ -0,0 +1,109 @@
+import logging
+import queue
+import threading
+import time
+
+from metrics import METRICS
+
+
+class ScoringScheduler:
+    """Call score_fn at a fixed rate on a dedicated worker thread.
+
+    A ticker thread enqueues one request every interval seconds, on a fixed
+    grid so the cadence does not drift with scoring time. The worker runs
+    score_fn for each request. Requests go through a bounded queue: when
+    scoring falls behind and the queue is full, new ticks are coalesced into
+    the one already waiting. That is safe because score_fn handles everything
+    pending, not a fixed slice. Queue depth and lag (how late a run starts
+    relative to its tick) are tracked in stats() and exported as metrics.
+    """
+
+    def __init__(self, interval, score_fn, queue_size=1, name="scoring"):
+        self.interval = interval
+        self.score_fn = score_fn
+        self.name = name
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self.ticks = 0
+        self.runs = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._tick_loop, name=f"{self.name}-ticker", daemon=True),
+            threading.Thread(target=self._work_loop, name=f"{self.name}-worker", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        """Stop ticking; a run already in progress is allowed to finish (up to timeout)."""
+        self._stop.set()
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def request(self):
+        """Ask for a run now (in addition to the fixed-rate ticks); coalesced if one is already waiting."""
+        try:
+            self._queue.put_nowait(time.monotonic())
+        except queue.Full:
+            with self._lock:
+                self.coalesced += 1
+            METRICS.inc("scheduler_coalesced_total", scheduler=self.name)
+        METRICS.set_gauge("scheduler_queue_depth", self._queue.qsize(), scheduler=self.name)
+
+    def _tick_loop(self):
+        next_tick = time.monotonic() + self.interval
+        while not self._stop.wait(max(0.0, next_tick - time.monotonic())):
+            with self._lock:
+                self.ticks += 1
+            self.request()
+            next_tick += self.interval
+            now = time.monotonic()
+            if next_tick < now:
+                # Skip ticks we slept through rather than firing them back to back.
+                next_tick += ((now - next_tick) // self.interval + 1) * self.interval
+
+    def _work_loop(self):
+        while True:
+            tick_time = self._queue.get()
+            if tick_time is None or self._stop.is_set():
+                break
+            lag = time.monotonic() - tick_time
+            with self._lock:
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+            METRICS.observe("scheduler_lag_seconds", lag, scheduler=self.name)
+            METRICS.set_gauge("scheduler_queue_depth", self._queue.qsize(), scheduler=self.name)
+            if lag > self.interval:
+                logging.warning(f"⏱ {self.name} is running {lag:.1f}s behind its {self.interval}s cadence")
+            try:
+                self.score_fn()
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                logging.error(f"{self.name} run failed: {e}")
+            with self._lock:
+                self.runs += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ticks": self.ticks,
+                "runs": self.runs,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "queue_depth": self._queue.qsize(),
+                "last_lag": self.last_lag,
+                "max_lag": self.max_lag,
+            }
@@ -0,0 +1,280 @@
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import isitllm
+from metrics import METRICS
+
+# Local HTTP service that scores many text or transcript streams at once.
+# Every session owns its own StreamingScorer, so per-caller state never lives
+# in globals; all sessions share the process-wide prediction cache and the
+# pooled keep-alive API client from isitllm.get_client().
+#
+#   POST   /sessions                    {"context_policy": "words:200"} -> {"session_id": ...}
+#   POST   /sessions/<id>/text          {"text": ..., "score": true}
+#   POST   /sessions/<id>/transcript    {"item_id": ..., "delta": ...} or {"item_id": ..., "transcript": ...}
+#   POST   /sessions/<id>/score         score the words queued so far
+#   GET    /sessions/<id>               running score and counters
+#   DELETE /sessions/<id>               score what is left and close the session
+#   GET    /metrics                     Prometheus text for the whole server
+
+
+class ScoringSession:
+    def __init__(self, session_id, context_policy, concurrency, max_pending_words):
+        self.session_id = session_id
+        self.scorer = isitllm.StreamingScorer(context_policy=context_policy, concurrency=concurrency,
+                                              max_pending_words=max_pending_words)
+        self.created_at = time.time()
+        self.last_seen = time.monotonic()
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def score(self):
+        segment_score, n_words, api_tokens = self.scorer.score_pending()
+        return {"segment_score": segment_score, "segment_words": n_words, "segment_api_tokens": api_tokens,
+                **self.summary()}
+
+    def summary(self):
+        scorer = self.scorer
+        return {
+            "session_id": self.session_id,
+            "score": scorer.score,
+            "predictions": scorer.predictions,
+            "correct": scorer.correct,
+            "api_tokens": scorer.api_tokens,
+            "pending_words": scorer.pending_words,
+            "skipped_words": scorer.skipped_words,
+        }
+
+
+class SessionManager:
+    """Create, look up and expire ScoringSessions; safe to use from many handler threads."""
+
+    def __init__(self, max_sessions=1000, idle_timeout=600.0, context_policy="words:200", concurrency=1,
+                 max_pending_words=None):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.context_policy = context_policy
+        self.concurrency = concurrency
+        self.max_pending_words = max_pending_words
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, context_policy=None):
+        # Validate before taking a slot, so a bad policy is a 400 and not a half-made session.
+        isitllm.parse_context_policy(context_policy or self.context_policy)
+        with self._lock:
+            self._expire_locked()
+            if len(self._sessions) >= self.max_sessions:
+                return None
+            session = ScoringSession(uuid.uuid4().hex, context_policy or self.context_policy, self.concurrency,
+                                     self.max_pending_words)
+            self._sessions[session.session_id] = session
+            METRICS.set_gauge("server_sessions", len(self._sessions))
+        METRICS.inc("server_sessions_total")
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is not None:
+            session.touch()
+        return session
+
+    def close(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            METRICS.set_gauge("server_sessions", len(self._sessions))
+        return session
+
+    def _expire_locked(self):
+        if not self.idle_timeout:
+            return
+        cutoff = time.monotonic() - self.idle_timeout
+        for session_id in [s.session_id for s in self._sessions.values() if s.last_seen < cutoff]:
+            del self._sessions[session_id]
+            METRICS.inc("server_sessions_expired_total")
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, sessions=None):
+        super().__init__(address, ScoringHandler)
+        self.sessions = sessions or SessionManager()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so a streaming caller reuses one connection
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    @staticmethod
+    def _field_error(request, action):
+        """Describe the first field of request with the wrong type for action, or None if they are all fine."""
+        fields = {"create": ("context_policy",), "text": ("text",), "transcript": ("item_id", "delta", "transcript")}
+        for field in fields.get(action, ()):
+            if request.get(field) is not None and not isinstance(request[field], str):
+                return f"'{field}' must be a string, not {type(request[field]).__name__}"
+        return None
+
+    def _route(self):
+        """Split the path into (session_id, action); session_id is None for /sessions itself."""
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        if not parts or parts[0] != "sessions" or len(parts) > 3:
+            return None
+        return (parts[1] if len(parts) > 1 else None), (parts[2] if len(parts) > 2 else None)
+
+    def _session(self, session_id):
+        session = self.server.sessions.get(session_id)
+        if session is None:
+            self._send_json(404, {"error": f"Unknown session {session_id}"})
+        return session
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body = METRICS.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path.split("?")[0] == "/healthz":
+            self._send_json(200, {"sessions": len(self.server.sessions), "cache": isitllm.cache_stats()})
+            return
+        route = self._route()
+        if route is None or route[0] is None or route[1] is not None:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        session = self._session(route[0])
+        if session:
+            self._send_json(200, session.summary())
+
+    def do_POST(self):
+        route = self._route()
+        try:
+            request = self._read_json()
+        except ValueError as e:  # also covers a body that is not UTF-8 or a bad Content-Length
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            return
+        if not isinstance(request, dict):
+            self._send_json(400, {"error": f"Request body must be a JSON object, not {type(request).__name__}"})
+            return
+        error = self._field_error(request, "create" if route == (None, None) else route and route[1])
+        if error:
+            self._send_json(400, {"error": error})
+            return
+        if route == (None, None):
+            try:
+                session = self.server.sessions.create(request.get("context_policy"))
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            if session is None:
+                self._send_json(503, {"error": "Too many sessions"})
+                return
+            self._send_json(201, {"session_id": session.session_id})
+            return
+        if route is None or route[0] is None or route[1] not in ("text", "transcript", "score"):
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        session = self._session(route[0])
+        if session is None:
+            return
+        action = route[1]
+        if action == "text":
+            session.scorer.feed_text(request.get("text") or "")
+        elif action == "transcript":
+            if request.get("transcript") is not None:
+                session.scorer.feed_completed(request.get("item_id"), request["transcript"])
+            else:
+                session.scorer.feed_delta(request.get("item_id"), request.get("delta") or "")
+        METRICS.inc("server_requests_total", action=action)
+        if action == "score" or request.get("score"):
+            with METRICS.timer("server_score_seconds"):
+                self._send_json(200, session.score())
+        else:
+            self._send_json(200, session.summary())
+
+    def do_DELETE(self):
+        route = self._route()
+        if route is None or route[0] is None or route[1] is not None:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        session = self.server.sessions.close(route[0])
+        if session is None:
+            self._send_json(404, {"error": f"Unknown session {route[0]}"})
+            return
+        session.scorer.flush_deltas()
+        self._send_json(200, session.score())
+
+
+def start_server(host="127.0.0.1", port=0, **options):
+    """Start a ScoringServer on a background thread; port 0 picks a free port."""
+    server = ScoringServer((host, port), SessionManager(**options))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve next-word scoring for many concurrent sessions over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    parser.add_argument("--idle-timeout", type=float, default=600.0, help="seconds before an idle session is dropped")
+    parser.add_argument("--context-policy", default="words:200", help="default policy for new sessions")
+    parser.add_argument("--concurrency", type=int, default=1, help="prediction threads per scoring request")
+    parser.add_argument("--max-pending-words", type=int, default=None,
+                        help="predict at most this many queued words per score request")
+    args = parser.parse_args(argv)
+
+    isitllm.init()
+    if not isitllm.openai.api_key:
+        print("Error: OPENAI_API_KEY not found. Please set it in your .env file or environment.")
+        return
+    server = ScoringServer((args.host, args.port), SessionManager(
+        max_sessions=args.max_sessions,
+        idle_timeout=args.idle_timeout,
+        context_policy=args.context_policy,
+        concurrency=args.concurrency,
+        max_pending_words=args.max_pending_words,
+    ))
+    print(f"Scoring server on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
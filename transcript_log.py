@@ -0,0 +1,340 @@
+import argparse
+import glob
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+# Structured transcript log for the realtime client, and offline replay.
+#
+# Records are JSON lines: {"session", "seq", "ts", "event", "item_id", "text"}
+# with event one of session_start, delta, completed or session_end. They are
+# buffered in memory and written in batches (one write per flush), flushed
+# at least every flush_seconds and fsynced every fsync_seconds. The log is a
+# series of numbered segment files next to the base path
+# (transcript.jsonl -> transcript.000001.jsonl, transcript.000002.jsonl, ...);
+# a segment is closed once it passes max_bytes. Nothing is deleted unless a
+# retention limit is set: keep (segments), max_total_bytes or max_age_days;
+# the oldest closed segments are then removed at start-up and on rotation
+# until the log fits.
+# Every run starts a new segment, so keep counts runs as much as rotations.
+# Each closed segment appends one line to
+# transcript.index.jsonl naming the sessions it holds, their first byte offset,
+# record count and time range, so replay can seek straight to a session.
+# Segments missing from the index (e.g. after a crash) are scanned instead.
+
+SEGMENT_DIGITS = 6
+
+
+def _split_base(path):
+    root, ext = os.path.splitext(path)
+    return root, ext or ".jsonl"
+
+
+def segment_paths(path):
+    """Existing segment files for base path, oldest first."""
+    root, ext = _split_base(path)
+    pattern = re.compile(re.escape(os.path.basename(root)) + r"\.(\d{%d})" % SEGMENT_DIGITS + re.escape(ext) + "$")
+    found = []
+    for candidate in glob.glob(f"{glob.escape(root)}.*{ext}"):
+        match = pattern.match(os.path.basename(candidate))
+        if match:
+            found.append((int(match.group(1)), candidate))
+    return [p for _, p in sorted(found)]
+
+
+def index_path(path):
+    root, ext = _split_base(path)
+    return f"{root}.index{ext}"
+
+
+class TranscriptLog:
+    """Append-only, batched, rotating JSONL transcript log for one writer process."""
+
+    def __init__(self, path="transcript.jsonl", session_id=None, flush_every=64, flush_seconds=1.0,
+                 fsync_seconds=5.0, max_bytes=10 * 1024 * 1024, keep=0, max_total_bytes=0, max_age_days=0):
+        self.path = path
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.fsync_seconds = fsync_seconds
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.max_total_bytes = max_total_bytes
+        self.max_age_days = max_age_days
+        self.segments_deleted = 0
+        self._root, self._ext = _split_base(path)
+        directory = os.path.dirname(self._root)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._seq = 0
+        self._fh = None
+        self._segment_number = 0
+        self._segment_sessions = {}
+        self._last_fsync = time.monotonic()
+        self._closed = False
+        self.records_written = 0
+        self.flushes = 0
+        self._stop = threading.Event()
+        self._prune()  # short runs never rotate, so retention is also applied when a run starts
+        self._open_segment()
+        self._flusher = threading.Thread(target=self._flush_loop, name="transcript-flusher", daemon=True)
+        self._flusher.start()
+        self.write("session_start")
+
+    def _open_segment(self):
+        existing = segment_paths(self.path)
+        if existing:
+            last = os.path.basename(existing[-1])[len(os.path.basename(self._root)) + 1:][:SEGMENT_DIGITS]
+            self._segment_number = max(self._segment_number, int(last))
+        while True:
+            self._segment_number += 1
+            self._segment_path = f"{self._root}.{self._segment_number:0{SEGMENT_DIGITS}d}{self._ext}"
+            try:
+                # Exclusive create: another writer on the same log gets the next number instead.
+                self._fh = open(self._segment_path, "xb")
+                break
+            except FileExistsError:
+                continue
+        self._segment_sessions = {}
+
+    def write(self, event, item_id=None, text=None):
+        """Queue one record; it reaches the file on the next batched flush."""
+        with self._lock:
+            if self._closed:
+                return
+            self._seq += 1
+            record = {"session": self.session_id, "seq": self._seq, "ts": time.time(), "event": event}
+            if item_id is not None:
+                record["item_id"] = item_id
+            if text is not None:
+                record["text"] = text
+            self._pending.append(record)
+            if len(self._pending) >= self.flush_every:
+                self._flush_locked()
+
+    def flush(self, fsync=False):
+        with self._lock:
+            self._flush_locked(fsync)
+
+    def _flush_locked(self, fsync=False):
+        if self._pending and self._fh is not None:
+            offset = self._fh.tell()
+            lines = [json.dumps(record, ensure_ascii=False) for record in self._pending]
+            self._fh.write(("\n".join(lines) + "\n").encode("utf-8"))
+            self._fh.flush()  # one write syscall per batch
+            for record in self._pending:
+                entry = self._segment_sessions.setdefault(
+                    record["session"], {"offset": offset, "records": 0, "first_ts": record["ts"]})
+                entry["records"] += 1
+                entry["last_ts"] = record["ts"]
+            self.records_written += len(self._pending)
+            self.flushes += 1
+            self._pending = []
+        if self._fh is None:
+            return
+        if fsync or time.monotonic() - self._last_fsync >= self.fsync_seconds:
+            os.fsync(self._fh.fileno())
+            self._last_fsync = time.monotonic()
+        if self._fh.tell() >= self.max_bytes:
+            self._close_segment()
+            self._prune()
+            self._open_segment()
+
+    def _close_segment(self):
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        size = self._fh.tell()
+        self._fh.close()
+        self._fh = None
+        if not self._segment_sessions:
+            if not size:
+                os.remove(self._segment_path)
+            return
+        entry = {"file": os.path.basename(self._segment_path), "bytes": size, "sessions": self._segment_sessions}
+        with open(index_path(self.path), "a", encoding="utf-8") as index:
+            index.write(json.dumps(entry) + "\n")
+
+    def _prune(self):
+        # Called between segments, so every existing segment is closed.
+        if not (self.keep or self.max_total_bytes or self.max_age_days):
+            return
+        segments = [(p, os.path.getsize(p), os.path.getmtime(p)) for p in segment_paths(self.path)]
+        total = sum(size for _, size, _ in segments)
+        cutoff = time.time() - self.max_age_days * 86400
+        for n, (old, size, mtime) in enumerate(segments):
+            if not ((self.keep and len(segments) - n > self.keep)
+                    or (self.max_total_bytes and total > self.max_total_bytes)
+                    or (self.max_age_days and mtime < cutoff)):
+                break
+            os.remove(old)
+            total -= size
+            self.segments_deleted += 1
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception:
+                pass  # a failed background flush is retried next tick or at close
+
+    def close(self):
+        """Write session_end, flush, fsync and close the segment (recording it in the index)."""
+        self.write("session_end")
+        self._stop.set()
+        self._flusher.join()
+        with self._lock:
+            if self._closed:
+                return
+            self._flush_locked(fsync=True)
+            self._closed = True
+            if self._fh is not None:
+                self._close_segment()
+
+    def stats(self):
+        return {"session": self.session_id, "records": self.records_written, "flushes": self.flushes,
+                "segment": self._segment_path}
+
+
+def load_index(path):
+    """{segment file name: index entry} for the closed segments of base path."""
+    entries = {}
+    try:
+        with open(index_path(path), encoding="utf-8") as index:
+            for line in index:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line
+                entries[entry["file"]] = entry
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def iter_records(path, session_id=None):
+    """Yield the logged records of base path in order, only those of session_id if given.
+
+    Indexed segments that do not hold the session are skipped without being
+    read, and reading starts at the session's first byte offset.
+    """
+    index = load_index(path)
+    for segment in segment_paths(path):
+        entry = index.get(os.path.basename(segment))
+        offset = 0
+        if entry is not None and session_id is not None:
+            session = entry["sessions"].get(session_id)
+            if session is None:
+                continue
+            offset = session["offset"]
+        for record in iter_records_from_file(segment, offset):
+            if session_id is None or record.get("session") == session_id:
+                yield record
+
+
+def iter_records_from_file(segment, offset=0):
+    with open(segment, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn write at a crash
+
+
+def list_sessions(path):
+    """{session id: {"records", "first_ts", "last_ts"}} over every segment."""
+    sessions = {}
+    index = load_index(path)
+    for segment in segment_paths(path):
+        entry = index.get(os.path.basename(segment))
+        if entry is not None:
+            parts = entry["sessions"].items()
+        else:
+            parts = {}
+            for record in iter_records_from_file(segment):
+                part = parts.setdefault(record["session"], {"records": 0, "first_ts": record["ts"]})
+                part["records"] += 1
+                part["last_ts"] = record["ts"]
+            parts = parts.items()
+        for session_id, part in parts:
+            summary = sessions.setdefault(session_id, {"records": 0, "first_ts": part["first_ts"]})
+            summary["records"] += part["records"]
+            summary["last_ts"] = part["last_ts"]
+    return sessions
+
+
+def replay(path, session_id, scorer, flush_interval=5.0, on_score=None):
+    """Feed a recorded session through scorer as fast as possible.
+
+    score_pending() runs whenever flush_interval seconds of recorded time
+    have passed, as the realtime client's scheduler would, and once more at
+    the end. on_score, if given, is called with each (segment_score,
+    n_words, api_tokens). Returns the number of records replayed.
+    """
+    next_flush = None
+    records = 0
+    for record in iter_records(path, session_id):
+        records += 1
+        if next_flush is None:
+            next_flush = record["ts"] + flush_interval
+        while record["ts"] >= next_flush:
+            result = scorer.score_pending()
+            if on_score and result[1]:
+                on_score(result)
+            next_flush += flush_interval
+        if record["event"] == "delta":
+            scorer.feed_delta(record.get("item_id"), record.get("text", ""))
+        elif record["event"] == "completed":
+            scorer.feed_completed(record.get("item_id"), record.get("text", ""))
+    scorer.flush_deltas()
+    result = scorer.score_pending()
+    if on_score and result[1]:
+        on_score(result)
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and replay transcript logs written by RealtimeLLMCheck.")
+    parser.add_argument("log", nargs="?", default="transcript.jsonl", help="base path of the log")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the recorded sessions")
+    replay_parser = commands.add_parser("replay", help="re-score recorded sessions without a mic or WebSocket")
+    replay_parser.add_argument("sessions", nargs="*", help="session ids; all sessions if none are given")
+    replay_parser.add_argument("--context-policy", default="words:200")
+    replay_parser.add_argument("--concurrency", type=int, default=1)
+    replay_parser.add_argument("--flush-interval", type=float, default=5.0, help="recorded seconds between scorings")
+    replay_parser.add_argument("--predictor", default=None, help="score with this local model instead of the API")
+    replay_parser.add_argument("-v", "--verbose", action="store_true", help="print every segment score")
+    args = parser.parse_args(argv)
+
+    sessions = list_sessions(args.log)
+    if args.command == "list":
+        for session_id, summary in sessions.items():
+            started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(summary["first_ts"]))
+            print(f"{session_id}  {started}  {summary['last_ts'] - summary['first_ts']:7.1f}s  "
+                  f"{summary['records']} records")
+        return
+
+    import isitllm
+
+    if args.predictor:
+        isitllm.set_predictor(args.predictor)
+    for session_id in args.sessions or list(sessions):
+        scorer = isitllm.StreamingScorer(context_policy=args.context_policy, concurrency=args.concurrency)
+        on_score = None
+        if args.verbose:
+            on_score = lambda r: print(f"  segment {r[0]:.1f}% over {r[1]} words (API tokens: {r[2]})")
+        start = time.perf_counter()
+        records = replay(args.log, session_id, scorer, args.flush_interval, on_score)
+        elapsed = time.perf_counter() - start
+        print(f"{session_id}: {scorer.score:.1f}% over {scorer.predictions} words ({records} records, "
+              f"{scorer.api_tokens} API tokens, {elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()